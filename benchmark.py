@@ -0,0 +1,387 @@
+"""
+Benchmarks of the fetch, parse and write stages, on a saved corpus of ssrn pages
+- parse: paper pages through parse_paper_page (the extraction of find_info_in_one_paper) and listing pages
+  through parsers.parse_listing (the extraction of find_lst_paper), with both parser backends
+- write: typed records through writers.py, in every OUTPUT_FORMAT
+- memory: records held per MB, as result lists (the output of find_info_in_one_paper) and as a writers.RecordBatch
+- end to end: the whole crawl of scrape_ssrn_all against a local fake_ssrn.py server, at several concurrency levels,
+  with both engines, every run in a fresh process and a fresh directory
+- the corpus is a directory of saved pages (--pages), a response cache (--cache),
+  or by default the synthetic pages of fake_ssrn.py, the same seed gives the same pages
+- every run appends one line to benchmarks.jsonl (commit, date, results), the file is not tracked by git,
+  and is compared with the last line: a result slower than --threshold is printed as a regression,
+  --check exits with 1 on a regression
+      python benchmark.py
+      python benchmark.py --pages saved_pages --levels 1,8,32 --latency 0.05
+      python benchmark.py --skip-e2e --check
+
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import socket
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import multiprocessing
+import urllib.request
+
+import parsers
+import writers
+import fake_ssrn
+import crawl_state
+import response_cache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# url of the topic page, the fake server answers any network
+TOPIC_URL = "https://www.ssrn.com/index.cfm/en/fen/"
+
+
+def load_corpus(pages_dir=None, cache_db=None, n_papers=200, seed=0):
+    """
+    :param pages_dir: str, directory of saved html pages, the listing pages are found by their "tbody"
+    :param cache_db: str, response cache, its paper pages and listing pages with a 200 are used
+    :param n_papers: int, number of synthetic papers if there is neither pages_dir nor cache_db
+    :param seed: int, seed of the synthetic pages
+    :return: list of (url, html) of the paper pages, list of html of the listing pages
+    """
+    papers, listings = [], []
+    if pages_dir:
+        for path in sorted(glob.glob(os.path.join(pages_dir, "*.htm*"))):
+            with open(path, 'rb') as file:
+                content = file.read()
+            if b"optClickTitle" in content:
+                listings.append(content)
+            else:
+                papers.append((path, content))
+    elif cache_db:
+        cache = response_cache.ResponseCache(cache_db)
+        papers = [(response.url, response.content) for response in cache.iter_responses(url_like="%papers.cfm%")
+                  if response.status_code == 200 and b"abstract-body" in response.content]
+        listings = [response.content for response in cache.iter_responses(url_like="%JELJOUR_Results%")
+                    if response.status_code == 200]
+        cache.close()
+    else:
+        synthetic = fake_ssrn.SyntheticSSRN(n_papers, n_sections=4, seed=seed)
+        for i in range(fake_ssrn.FIRST_ID, fake_ssrn.FIRST_ID + n_papers):
+            papers.append((f"https://papers.ssrn.com/sol3/papers.cfm?abstract_id={i}", synthetic.paper(i)[2]))
+        for journal_id in range(1, synthetic.n_sections + 1):
+            n_total = -(-len(synthetic.sections[journal_id - 1]) // synthetic.page_size)
+            listings.extend(synthetic.listing(journal_id, npage)[2] for npage in range(1, n_total + 1))
+    return papers, listings
+
+
+def best_time(func, repeat):
+    """
+    :param func: function without argument
+    :param repeat: int, number of runs
+    :return: float, seconds of the fastest run, the other runs are noise (gc, other processes)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_parse(papers, listings, repeat):
+    """
+    :param papers: list of (url, html)
+    :param listings: list of html
+    :param repeat: int
+    :return: dict, name ==> pages per second
+    """
+    import scrape_ssrn_all as ssrn
+
+    results = {}
+    backends = ["bs4"] + (["lxml"] if parsers.etree is not None else [])
+    for backend in backends:
+        if papers:
+            seconds = best_time(lambda: [ssrn.parse_paper_page((url, 200, content), backend)
+                                         for url, content in papers], repeat)
+            results[f"parse_paper[{backend}] pages/s"] = len(papers) / seconds
+        if listings:
+            seconds = best_time(lambda: [parsers.parse_listing(content, get_total=True, backend=backend)
+                                         for content in listings], repeat)
+            results[f"parse_listing[{backend}] pages/s"] = len(listings) / seconds
+    return results
+
+
+def bench_write(papers, repeat, n_records=20000, batch_size=1000):
+    """
+    :param papers: list of (url, html), parsed once, the records are repeated up to n_records
+    :param repeat: int
+    :param n_records: int, number of records written in every run
+    :param batch_size: int, records written at a time, as OUTPUT_BATCH_SIZE
+    :return: dict, name ==> records per second
+    """
+    import scrape_ssrn_all as ssrn
+
+    records = []
+    for url, content in papers:
+        results, status, error, cit = ssrn.parse_paper_page((url, 200, content))
+        if status == crawl_state.DONE:
+            records.append(writers.to_record(results, status))
+    if not records:
+        return {}
+    records = (records * (n_records // len(records) + 1))[:n_records]
+
+    batches = [writers.RecordBatch(records[i:i + batch_size]) for i in range(0, len(records), batch_size)]
+
+    def write(output_format):
+        with tempfile.TemporaryDirectory() as directory:
+            writer = writers.open_writer(directory, output_format)
+            for batch in batches:
+                writer.write(batch)
+            writer.close()
+
+    results = {}
+    formats = [output_format for output_format in writers.FORMATS
+               if output_format != "parquet" or writers.pyarrow is not None]
+    for output_format in formats:
+        results[f"write[{output_format}] records/s"] = len(records) / best_time(lambda: write(output_format), repeat)
+    return results
+
+
+def bench_memory(papers, n_records=20000):
+    """
+    :param papers: list of (url, html), parsed once, every record is built again from a copy of its results,
+                   as the pages of n_records different papers would be
+    :param n_records: int
+    :return: dict, name ==> records per MB held in memory, higher is better
+    """
+    import scrape_ssrn_all as ssrn
+
+    lst_results = []
+    for url, content in papers:
+        results, status, error, cit = ssrn.parse_paper_page((url, 200, content))
+        if status == crawl_state.DONE:
+            lst_results.append(results)
+    if not lst_results:
+        return {}
+
+    def copies():
+        # new strings for every record, as a parser makes them
+        for i in range(n_records):
+            yield [(text + ".")[:-1] for text in lst_results[i % len(lst_results)]]
+
+    def held(build):
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return n_records / (size / 2 ** 20)
+
+    return {"memory[result lists] records/MB": held(lambda: list(copies())),
+            "memory[record batch] records/MB": held(lambda: writers.RecordBatch(
+                writers.to_record(results, crawl_state.DONE) for results in copies()))}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_stats(url):
+    """
+    :param url: str, url of the fake server
+    :return: dict, "<kind of page> <status code>" ==> number of requests
+    """
+    with urllib.request.urlopen(url + "/__stats__") as response:
+        return json.loads(response.read())
+
+
+def start_server(n_papers, n_sections, latency, cache_db=None, seed=0):
+    """
+    Start fake_ssrn.py in its own process, so the server does not share the GIL of the crawl
+
+    :return: subprocess.Popen, url of the server
+    """
+    port = free_port()
+    command = [sys.executable, os.path.join(HERE, "fake_ssrn.py"), "--port", str(port),
+               "--papers", str(n_papers), "--sections", str(n_sections),
+               "--latency", str(latency), "--seed", str(seed)]
+    if cache_db:
+        command += ["--cache", cache_db]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            server_stats(url)
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("the fake server did not start")
+
+
+def _crawl(engine, concurrency, n_parsers, replay_url, directory, queue):
+    # runs in a fresh process: the settings and the shared state of scrape_ssrn_all are module globals
+    sys.path.insert(0, HERE)
+    os.chdir(directory)
+    sys.stdout = sys.stderr = open(os.devnull, 'w')
+
+    import scrape_ssrn_all as ssrn
+
+    ssrn.configure(ENGINE=engine, NUM_THREADS=concurrency, NUM_PARSERS=n_parsers, CACHE_DB=None, CITATIONS=False,
+                   REPLAY_URL=replay_url)
+
+    lst_url = ssrn.get_link_for_all_section_in_one_topic(TOPIC_URL)
+    lst_section = [(section["url"].replace("&amp;", "&"), f"section_{i}") for i, section in enumerate(lst_url)]
+
+    start = time.perf_counter()
+    ssrn.get_engine().crawl_sections(lst_section)
+    queue.put(time.perf_counter() - start)
+
+
+def bench_e2e(levels, engines, n_papers, n_sections, latency, n_parsers, cache_db=None):
+    """
+    :param levels: list of int, concurrency levels (NUM_THREADS)
+    :param engines: list of "thread" / "async"
+    :param n_papers: int, number of papers of the fake server
+    :param n_sections: int
+    :param latency: float, seconds of the fake server before every answer
+    :param n_parsers: int, NUM_PARSERS of the crawl
+    :param cache_db: str, response cache replayed by the server
+    :return: dict, name ==> pages per second
+    """
+    process, url = start_server(n_papers, n_sections, latency, cache_db)
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    try:
+        for engine in engines:
+            for concurrency in levels:
+                n_before = sum(server_stats(url).values())
+                with tempfile.TemporaryDirectory() as directory:
+                    queue = context.Queue()
+                    crawl = context.Process(target=_crawl,
+                                            args=(engine, concurrency, n_parsers, url, directory, queue))
+                    crawl.start()
+                    crawl.join()
+                    if crawl.exitcode != 0:
+                        print(f"e2e[{engine},c={concurrency}] failed with exit code {crawl.exitcode}")
+                        continue
+                    seconds = queue.get()
+                n_pages = sum(server_stats(url).values()) - n_before
+                results[f"e2e[{engine},c={concurrency}] pages/s"] = n_pages / seconds
+                print(f"e2e[{engine},c={concurrency}]: {n_pages} pages in {seconds:.1f}s")
+    finally:
+        process.kill()
+        process.wait()
+    return results
+
+
+def git_commit():
+    """
+    :return: str, short hash of the current commit, with "+" if the tree has changes, None outside of git
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("+" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_last_run(path, corpus):
+    """
+    :param path: str, jsonl file of the runs
+    :param corpus: str, only the runs on the same corpus are compared
+    :return: dict, the last run on the corpus, None if there is none
+    """
+    if not os.path.exists(path):
+        return None
+    last = None
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                run = json.loads(line)
+                if run.get("corpus") == corpus:
+                    last = run
+    return last
+
+
+def compare(results, last, threshold):
+    """
+    print every result next to the last run
+
+    :param results: dict, name ==> throughput, higher is better
+    :param last: dict, the last run, None if there is none
+    :param threshold: float, eg. 0.1 flags the results more than 10% slower
+    :return: list of the names of the results that regressed
+    """
+    previous = last["results"] if last else {}
+    regressions = []
+    print("-" * 80)
+    if last:
+        print(f"compared with {last.get('commit')} of {last.get('date')}")
+    for name, value in results.items():
+        line = f"{name:40s} {value:12.1f}"
+        if name in previous and previous[name] > 0:
+            change = value / previous[name] - 1
+            line += f"  {change:+7.1%}"
+            if change < -threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmarks of the fetch, parse and write stages")
+    parser.add_argument("--pages", default=None, help="directory of saved html pages")
+    parser.add_argument("--cache", default=None, help="response cache with recorded pages")
+    parser.add_argument("--papers", type=int, default=200, help="synthetic papers of the parse and write benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of every parse and write benchmark, the best counts")
+    parser.add_argument("--skip-e2e", action="store_true", help="only the parse and write benchmarks")
+    parser.add_argument("--levels", default="1,8,32", help="concurrency levels of the end-to-end crawl")
+    parser.add_argument("--engines", default="thread,async", help="engines of the end-to-end crawl")
+    parser.add_argument("--e2e-papers", type=int, default=300, help="papers of the fake server")
+    parser.add_argument("--e2e-sections", type=int, default=3, help="sections of the fake server")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds of the fake server before every answer")
+    parser.add_argument("--parsers", type=int, default=0, help="NUM_PARSERS of the end-to-end crawl")
+    parser.add_argument("--results", default=os.path.join(HERE, "benchmarks.jsonl"), help="jsonl file of the runs")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown flagged as a regression")
+    parser.add_argument("--check", action="store_true", help="exit with 1 if a result regressed")
+    args = parser.parse_args(argv)
+
+    papers, listings = load_corpus(args.pages, args.cache, args.papers)
+    print(f"corpus: {len(papers)} paper pages, {len(listings)} listing pages")
+
+    results = {}
+    results.update(bench_parse(papers, listings, args.repeat))
+    results.update(bench_write(papers, args.repeat))
+    results.update(bench_memory(papers))
+    if not args.skip_e2e:
+        engines = [engine for engine in args.engines.split(",") if engine]
+        levels = [int(level) for level in args.levels.split(",") if level]
+        results.update(bench_e2e(levels, engines, args.e2e_papers, args.e2e_sections, args.latency,
+                                 args.parsers, args.cache))
+
+    corpus = args.pages or args.cache or f"synthetic:{args.papers}"
+    regressions = compare(results, load_last_run(args.results, corpus), args.threshold)
+
+    run = {"commit": git_commit(), "date": datetime.datetime.now().isoformat(timespec="seconds"),
+           "python": platform.python_version(), "machine": platform.machine(), "corpus": corpus,
+           "results": {name: round(value, 1) for name, value in results.items()}}
+    with open(args.results, 'a', encoding="utf-8") as file:
+        file.write(json.dumps(run) + "\n")
+    print(f"results appended to {args.results}")
+
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Deferred citation counts
+- the paper stage only records the link of the citation widget of every paper, it never waits for it
+- the links are kept in SQLite, once per abstract_id, so a paper scraped twice or in several sections is counted once
+- the widgets are requested later, in their own stage on an asyncio event loop (see async_engine.fetch_citations),
+  total_items is read from the json, without BeautifulSoup
+- the counts are written to ssrn_citations.csv, one row (abstract_id, n_cit), join them to the records on abstract_id
+
+"""
+
+import time
+import sqlite3
+import threading
+
+from crawl_state import PENDING, DONE, FAILED
+
+
+class CitationStore:
+    """
+    Link of the citation widget and number of citations of every paper, shared by all threads
+    """
+
+    def __init__(self, path="ssrn_crawl_state.db"):
+        """
+        :param path: str, path of the sqlite file, it is created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS citations (
+                abstract_id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                n_cit INTEGER,
+                updated_at REAL
+            )
+        """)
+
+    def add(self, abstract_id, url):
+        """
+        Record the link of the citation widget of one paper, the papers already known are left as they are
+
+        :param abstract_id: int
+        :param url: str, link of the citation widget
+        :return:
+        """
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO citations (abstract_id, url, status, updated_at) "
+                               "VALUES (?, ?, ?, ?)", (abstract_id, url, PENDING, time.time()))
+
+    def reset(self, abstract_ids):
+        """
+        Set papers back to pending, eg. to refresh their citation counts, the last counts stay until then
+
+        :param abstract_ids: iterable of int
+        :return:
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("UPDATE citations SET status = ?, updated_at = ? WHERE abstract_id = ?",
+                                   ((PENDING, now, abstract_id) for abstract_id in abstract_ids))
+            self._conn.execute("COMMIT")
+
+    def set_counts(self, counts):
+        """
+        :param counts: list of (abstract_id, n_cit), n_cit is None if the widget did not work,
+                       the last count is kept then
+        :return:
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("UPDATE citations SET status = ?, n_cit = COALESCE(?, n_cit), updated_at = ? "
+                                   "WHERE abstract_id = ?",
+                                   ((FAILED if n_cit is None else DONE, n_cit, now, abstract_id)
+                                    for abstract_id, n_cit in counts))
+            self._conn.execute("COMMIT")
+
+    def iter_pending(self, batch_size=1000):
+        """
+        Read the widgets to request lazily, the pending ones and the ones that failed
+
+        :param batch_size: int, number of rows read at a time
+        :return: generator of (abstract_id, url)
+        """
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute("SELECT abstract_id, url FROM citations "
+                                          "WHERE abstract_id > ? AND status IN (?, ?) ORDER BY abstract_id LIMIT ?",
+                                          (last, PENDING, FAILED, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                last = row[0]
+                yield row
+
+    def iter_counts(self, batch_size=1000):
+        """
+        :param batch_size: int, number of rows read at a time
+        :return: generator of (abstract_id, n_cit), for the papers with a count, the last one if it is refreshed
+        """
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute("SELECT abstract_id, n_cit FROM citations "
+                                          "WHERE abstract_id > ? AND n_cit IS NOT NULL ORDER BY abstract_id LIMIT ?",
+                                          (last, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                last = row[0]
+                yield row
+
+    def count(self):
+        """
+        :return: dict, number of papers for every status
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM citations GROUP BY status").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,137 @@
+"""
+Command line of the scrapers, every mode runs on the engine of scrape_ssrn_all.py
+    python cli.py topic --journal-id 1175282        the papers of one journal (formerly scrape_ssrn.py)
+    python cli.py network                           all the sections of the Financial Economics Network
+    python cli.py refresh --budget 0.2              incremental recrawl of the papers already scraped
+    python cli.py coordinator / worker              distributed crawl of the network, see leases.py
+    python cli.py citations                         the citation counts that are still missing
+    python cli.py reparse                           parse the cached paper pages again, offline
+    python cli.py reparse --partial                 only the partly parsed ones, into the files of their sections
+- the options override the SCRAPER SETTINGS of scrape_ssrn_all.py, eg. --threads 25 --engine async,
+  --set NAME=VALUE sets any other one, the value is read as python, eg. --set 'ENDPOINTS=[{"kind": "direct"}]'
+
+"""
+
+import ast
+import sys
+import argparse
+
+import transport
+import scrape_ssrn
+import scrape_ssrn_all as core
+
+# option ==> setting
+OPTIONS = {
+    "api_key": "API_KEY",
+    "threads": "NUM_THREADS",
+    "parsers": "NUM_PARSERS",
+    "engine": "ENGINE",
+    "parser": "PARSER",
+    "output_format": "OUTPUT_FORMAT",
+    "state_db": "STATE_DB",
+    "cache_db": "CACHE_DB",
+    "replay_url": "REPLAY_URL",
+    "metrics_port": "METRICS_PORT",
+    "profile": "PROFILE_SAMPLE",
+    "section_quota": "SECTION_QUOTA",
+    "time_limit": "CRAWL_SECONDS",
+    "lease_db": "LEASE_DB",
+}
+
+
+def settings_of_args(args):
+    """
+    :param args: argparse.Namespace
+    :return: dict, setting ==> value, only the options given
+    """
+    settings = {setting: getattr(args, option) for option, setting in OPTIONS.items()
+                if getattr(args, option) is not None}
+    if args.no_citations:
+        settings["CITATIONS"] = False
+    if args.recrawl_listings:
+        settings["LISTING_RECRAWL"] = True
+    if args.priority is not None:
+        settings["PRIORITY_KEYS"] = tuple(key.strip() for key in args.priority.split(",") if key.strip())
+    if settings.get("SECTION_QUOTA", 0) >= 1:
+        settings["SECTION_QUOTA"] = int(settings["SECTION_QUOTA"])
+    # the budget of the refresh mode is given to refresh_papers
+    if args.budget is not None and args.mode in ("topic", "network", "coordinator"):
+        settings["PAPER_BUDGET"] = int(args.budget)
+    for assignment in args.set:
+        name, _, text = assignment.partition("=")
+        try:
+            value = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            # a plain string, eg. --set PARSER=bs4
+            value = text
+        settings[name.strip()] = value
+    return settings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="scrape ssrn: one journal or a whole network, on one engine")
+    parser.add_argument("mode", choices=("topic", "network", "refresh", "coordinator", "worker", "citations",
+                                         "reparse"))
+    parser.add_argument("--journal-id", type=int, default=core.TOPIC_JOURNAL_ID, help="journal of the topic mode")
+    parser.add_argument("--topic-url", default=core.FEN_URL, help="topic page of the network mode")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="papers of the run, PAPER_BUDGET, a share if < 1 in the refresh mode")
+    parser.add_argument("--priority", default=None, metavar="KEYS",
+                        help="PRIORITY_KEYS, eg. fewest_done,newest or downloads, empty for the order they are found")
+    parser.add_argument("--section-quota", type=float, default=None,
+                        help="SECTION_QUOTA, papers per section, a share of the budget if < 1")
+    parser.add_argument("--time-limit", type=float, default=None, metavar="SECONDS",
+                        help="CRAWL_SECONDS, no new page after that many seconds")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--threads", type=int, default=None, help="NUM_THREADS, requests in flight")
+    parser.add_argument("--parsers", type=int, default=None, help="NUM_PARSERS, parser processes")
+    parser.add_argument("--engine", choices=("thread", "async"), default=None)
+    parser.add_argument("--parser", choices=("lxml", "bs4"), default=None)
+    parser.add_argument("--output-format", choices=("csv", "jsonl", "parquet"), default=None)
+    parser.add_argument("--state-db", default=None)
+    parser.add_argument("--cache-db", default=None)
+    parser.add_argument("--replay-url", default=None, help="eg. http://127.0.0.1:8777, a local fake_ssrn.py")
+    parser.add_argument("--metrics-port", type=int, default=None)
+    parser.add_argument("--profile", type=float, default=None, metavar="SAMPLE",
+                        help="PROFILE_SAMPLE, share of the pages profiled, eg. 0.05")
+    parser.add_argument("--lease-db", default=None)
+    parser.add_argument("--no-citations", action="store_true", help="skip the citation widgets")
+    parser.add_argument("--partial", action="store_true", help="reparse only the partly parsed papers")
+    parser.add_argument("--recrawl-listings", action="store_true",
+                        help="request the listing pages again to find the new papers, see LISTING_RECRAWL")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="any other setting")
+    args = parser.parse_args(argv)
+
+    if args.mode == "topic":
+        # the settings of scrape_ssrn.py (endpoints, rate), the options win
+        scrape_ssrn.configure(**settings_of_args(args))
+    else:
+        core.configure(**settings_of_args(args))
+
+    if args.mode == "topic":
+        core.crawl_journal(args.journal_id)
+    elif args.mode == "network":
+        core.crawl_network(args.topic_url)
+    elif args.mode == "coordinator":
+        core.crawl_network(args.topic_url, role="coordinator")
+    elif args.mode == "worker":
+        core.work_on_leases()
+        transport.print_stats()
+    elif args.mode == "refresh":
+        budget = args.budget
+        if budget is not None and budget >= 1:
+            budget = int(budget)
+        core.refresh_papers(budget)
+        transport.print_stats()
+    elif args.mode == "citations":
+        core.fetch_citations()
+    elif args.mode == "reparse":
+        if args.partial:
+            core.reparse_partial()
+        else:
+            core.reparse_cache()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
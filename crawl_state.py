@@ -0,0 +1,248 @@
+"""
+Durable crawl state in SQLite (WAL mode)
+- one row per url and section: kind (listing / paper), status, number of results recorded, last error
+  (one per run that finished the url, the retries of a run are counted by retry.Retrier, see RETRY_POLICIES)
+- status is one of pending, done, failed, not-found, partial (the page is here, some fields did not parse,
+  it is parsed again from the response cache, not requested again), cross-listed (a paper of several sections,
+  fetched and written for another one)
+- a crash or a Ctrl-C loses nothing that was written, a new run skips the urls that are done
+  with a lookup on the primary key
+- what the listing pages tell of a paper (date posted, downloads) is kept to rank it before it is requested,
+  in this run and the next ones, see scheduler.py
+
+"""
+
+import time
+import sqlite3
+import threading
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+NOT_FOUND = "not-found"
+PARTIAL = "partial"
+CROSS_LISTED = "cross-listed"
+
+# urls with these status are not requested again
+FINISHED = (DONE, NOT_FOUND, PARTIAL, CROSS_LISTED)
+
+LISTING = "listing"
+PAPER = "paper"
+
+
+class CrawlState:
+    """
+    Status of every url of the crawl, shared by all threads
+    """
+
+    def __init__(self, path="ssrn_crawl_state.db"):
+        """
+        :param path: str, path of the sqlite file, it is created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT NOT NULL,
+                section TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                n_results INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL,
+                PRIMARY KEY (url, section)
+            );
+            CREATE INDEX IF NOT EXISTS urls_section ON urls (section, kind, status);
+            CREATE TABLE IF NOT EXISTS sections (
+                section TEXT PRIMARY KEY,
+                n_total INTEGER,
+                page_size INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS hints (
+                url TEXT PRIMARY KEY,
+                posted TEXT,
+                downloads INTEGER
+            );
+        """)
+        # the state files written before the page size was recorded
+        if "page_size" not in [row[1] for row in self._conn.execute("PRAGMA table_info(sections)")]:
+            self._conn.execute("ALTER TABLE sections ADD COLUMN page_size INTEGER")
+        # the state files written when the column was named after the attempts it never counted
+        if "attempts" in [row[1] for row in self._conn.execute("PRAGMA table_info(urls)")]:
+            self._conn.execute("ALTER TABLE urls RENAME COLUMN attempts TO n_results")
+
+    def add(self, urls, section, kind):
+        """
+        Add urls as pending, the urls already known keep their status
+
+        :param urls: iterable of str
+        :param section: str, name of the section
+        :param kind: LISTING or PAPER
+        :return:
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO urls (url, section, kind, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                ((url, section, kind, PENDING, now) for url in urls))
+            self._conn.execute("COMMIT")
+
+    def mark(self, urls, section, status, error=None):
+        """
+        Set the status of urls, and count one more result recorded
+
+        :param urls: str or list of str
+        :param section: str, name of the section
+        :param status: DONE, FAILED, NOT_FOUND, PARTIAL or PENDING
+        :param error: str, last error, None if it worked
+        :return:
+        """
+        if isinstance(urls, str):
+            urls = [urls]
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE urls SET status = ?, n_results = n_results + 1, last_error = ?, updated_at = ? "
+                "WHERE url = ? AND section = ?",
+                ((status, error, now, url, section) for url in urls))
+            self._conn.execute("COMMIT")
+
+    def mark_cross_listed(self, papers):
+        """
+        Finish the papers fetched for another section in the sections that list them too,
+        only the papers that are pending or failed there change
+
+        :param papers: iterable of (url, section, the section the paper was fetched for, None if unknown)
+        :return:
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE urls SET status = ?, n_results = n_results + 1, last_error = ?, updated_at = ? "
+                "WHERE url = ? AND section = ? AND status IN (?, ?)",
+                ((CROSS_LISTED, f"fetched for {other}" if other else None, now, url, section, PENDING, FAILED)
+                 for url, section, other in papers))
+            self._conn.execute("COMMIT")
+
+    def status(self, url, section):
+        """
+        :param url: str
+        :param section: str
+        :return: status of the url, None if it is unknown
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM urls WHERE url = ? AND section = ?",
+                                     (url, section)).fetchone()
+        return row[0] if row else None
+
+    def is_finished(self, url, section):
+        """
+        :param url: str
+        :param section: str
+        :return: bool, True if the url is done or not found, no need to request it again
+        """
+        return self.status(url, section) in FINISHED
+
+    def iter_urls(self, section, kind, statuses=None, batch_size=1000):
+        """
+        Read the urls of one section lazily, in the order they were added
+
+        :param section: str
+        :param kind: LISTING or PAPER
+        :param statuses: tuple of status, None for all
+        :param batch_size: int, number of rows read at a time
+        :return: generator of str
+        """
+        query = "SELECT rowid, url FROM urls WHERE section = ? AND kind = ? AND rowid > ?"
+        if statuses:
+            query += " AND status IN ({})".format(",".join("?" * len(statuses)))
+        query += " ORDER BY rowid LIMIT ?"
+
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(query, (section, kind, last, *(statuses or ()), batch_size)).fetchall()
+            if not rows:
+                return
+            for last, url in rows:
+                yield url
+
+    def count(self, section, kind):
+        """
+        :param section: str
+        :param kind: LISTING or PAPER
+        :return: dict, number of urls for every status
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM urls WHERE section = ? AND kind = ? GROUP BY status",
+                                      (section, kind)).fetchall()
+        return dict(rows)
+
+    def sections(self):
+        """
+        :return: list of the names of the sections whose first listing page was scraped
+        """
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT section FROM sections ORDER BY section")]
+
+    def set_n_total(self, section, n_total, page_size=None):
+        """
+        Save the total number of listing pages of one section
+        :param section: str
+        :param n_total: int
+        :param page_size: int, papers per listing page asked for, None for the default of ssrn
+        :return:
+        """
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sections (section, n_total, page_size) VALUES (?, ?, ?)",
+                               (section, n_total, page_size))
+
+    def get_n_total(self, section):
+        """
+        :param section: str
+        :return: int, total number of listing pages, None if the first page was never scraped
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT n_total FROM sections WHERE section = ?", (section,)).fetchone()
+        return row[0] if row else None
+
+    def get_page_size(self, section):
+        """
+        :param section: str
+        :return: int, papers per listing page asked for in the previous runs, None for the default of ssrn
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT page_size FROM sections WHERE section = ?", (section,)).fetchone()
+        return row[0] if row else None
+
+    def set_hints(self, hints):
+        """
+        Save what the listing pages tell of the papers, the last listing page wins
+
+        :param hints: dict, paper url ==> (date posted, iso format or None, downloads or None)
+        :return:
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR REPLACE INTO hints (url, posted, downloads) VALUES (?, ?, ?)",
+                                   ((url, posted, downloads) for url, (posted, downloads) in hints.items()))
+            self._conn.execute("COMMIT")
+
+    def get_hints(self, url):
+        """
+        :param url: str, paper url
+        :return: date posted (iso format), downloads, None if no listing page told
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT posted, downloads FROM hints WHERE url = ?", (url,)).fetchone()
+        return row if row else (None, None)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
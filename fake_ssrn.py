@@ -0,0 +1,442 @@
+"""
+Local stand-in of ssrn and of the scraper API, to measure and test the crawl on localhost without spending credits
+- it replays the pages recorded in a response cache (see response_cache.py),
+  the pages that are not recorded come from a synthetic corpus with the same html as ssrn:
+  topic page, network-subject-areas json, listing pages, paper pages and citation widget json
+- latency, jitter, server errors (5xx), 429s, soft-block pages ("Page Cannot be Found" with a 200)
+  and dropped connections are configurable, every request draws its own fault
+- it answers both kinds of requests:
+      scraper API: http://127.0.0.1:8777/?api_key=...&url=https://papers.ssrn.com/sol3/papers.cfm?abstract_id=1
+      direct: http://127.0.0.1:8777/sol3/papers.cfm?abstract_id=1, the host of the page in the X-Original-Host header
+  transport.REPLAY_URL sends every request of both scrapers there
+- run the server, then set REPLAY_URL = "http://127.0.0.1:8777" in scrape_ssrn_all.py or scrape_ssrn.py:
+      python fake_ssrn.py --port 8777 --papers 5000 --sections 5 --latency 0.05 --error-rate 0.01
+      python fake_ssrn.py --cache recorded_cache.db
+- --drift makes the views and downloads of a third of the papers grow over time, --etag sends an ETag
+  and answers a conditional request with a 304, to test the incremental recrawl (see refresh.py)
+- --quota gives every api_key that many requests, then a 403 as scraper API does when the credits are exhausted,
+  to test the endpoint pool (see endpoints.py)
+- a listing page takes the page size of its perpage parameter, up to --max-page-size, see LISTING_PAGE_SIZES
+- --partial-rate gives some papers a page whose affiliations the parsers cannot read, to test the partly parsed
+  pages (see scrape_ssrn_all.reparse_partial)
+- GET /__stats__ returns the number of requests for every kind of page and status code
+
+"""
+
+import sys
+import json
+import time
+import hashlib
+import random
+import argparse
+import threading
+import collections
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urlunsplit, parse_qs
+
+from metrics import kind_of_url
+from response_cache import ResponseCache
+
+# header of a direct request, the host of the page the request was sent for
+ORIGINAL_HOST = "X-Original-Host"
+
+# ssrn sends the same page for a missing paper (404) and for a soft block (200)
+NOT_FOUND_PAGE = b"<html><head><title>SSRN</title></head><body><h1>Page Cannot be Found</h1></body></html>"
+# a 200 that is neither a listing page nor a paper page
+CAPTCHA_PAGE = b"<html><head><title>Just a moment...</title></head><body><h1>Verify you are human</h1></body></html>"
+
+ABSTRACT_SENTENCE = 'Returns are predictable, and "risk" is priced.'
+
+# first abstract_id of the synthetic papers
+FIRST_ID = 3000000
+
+
+class SyntheticSSRN:
+    """
+    Topic, sections, listing pages, papers and citation counts made up from a seed, the same seed gives the same pages
+    """
+
+    def __init__(self, n_papers=1000, n_sections=5, page_size=20, cross_listed=0.2, seed=0, drift=0.0,
+                 max_page_size=200, partial=0.0):
+        """
+        :param n_papers: int, number of papers
+        :param n_sections: int, number of sections of the topic
+        :param page_size: int, number of papers of one listing page
+        :param max_page_size: int, largest page size a listing page accepts (perpage), a larger one gets the default
+        :param partial: float, share of the papers whose page has no affiliation block, always the same papers
+        :param cross_listed: float, share of the papers listed in a second section
+        :param seed: int
+        :param drift: float, the views and downloads of a third of the papers grow every drift seconds, 0 never
+        """
+        self.n_papers = n_papers
+        self.n_sections = n_sections
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.partial = partial
+        self.seed = seed
+        self.drift = drift
+
+        # abstract_ids of every section, the newest first as on ssrn
+        rng = random.Random(seed)
+        self.sections = [[] for _ in range(n_sections)]
+        for i in range(n_papers):
+            section = i % n_sections
+            self.sections[section].append(FIRST_ID + i)
+            if n_sections > 1 and rng.random() < cross_listed:
+                self.sections[(section + rng.randrange(1, n_sections)) % n_sections].append(FIRST_ID + i)
+        for ids in self.sections:
+            ids.sort(reverse=True)
+
+    def page(self, url):
+        """
+        :param url: str, url of the ssrn page
+        :return: status code, content type, body (bytes)
+        """
+        parts = urlsplit(url.replace("&amp;", "&"))
+        query = {name: values[0] for name, values in parse_qs(parts.query).items()}
+        path = parts.path.lower()
+
+        if path.endswith("/papers.cfm") and query.get("abstract_id", "").isdigit() and int(query["abstract_id"]) > 0:
+            return self.paper(int(query["abstract_id"]))
+        if path.endswith("/jeljour_results.cfm") and query.get("journal_id", "").isdigit():
+            return self.listing(int(query["journal_id"]), int(query.get("npage", "1") or 1),
+                                int(query.get("perpage", "0") or 0))
+        if "citations-widget" in path and query.get("abstract_id", "").isdigit():
+            return self.citations(int(query["abstract_id"]))
+        if "subject-areas" in path:
+            return self.subject_areas()
+        if path.startswith("/index.cfm/en/"):
+            return self.topic(parts.path)
+        return 404, "text/html", NOT_FOUND_PAGE
+
+    def topic(self, path):
+        html = f"""<html><head><title>Financial Economics Network (FEN) :: SSRN</title></head><body>
+<div class="container">
+<h1>Financial Economics Network</h1>
+<div id="network-subject-areas" data-url="https://www.ssrn.com/index.cfm/en/subject-areas/?network={path.strip('/').split('/')[-1]}"></div>
+</div></body></html>"""
+        return 200, "text/html", html.encode()
+
+    def subject_areas(self):
+        journals = [{"url": f"https://papers.ssrn.com/sol3/JELJOUR_Results.cfm?form_name=journalBrowse&amp;journal_id={j + 1}",
+                     "name": f"Section {j + 1} (Fake), Topics & Methods"}
+                    for j in range(self.n_sections)]
+        return 200, "application/json", json.dumps({"journals": journals}).encode()
+
+    def listing(self, journal_id, npage, perpage=0):
+        # the journal_id of a real section gets one of the synthetic sections
+        ids = self.sections[(journal_id - 1) % self.n_sections]
+        page_size = perpage if 0 < perpage <= self.max_page_size else self.page_size
+        n_total = max(1, -(-len(ids) // page_size))
+        rows = "\n".join(f"""<div class="trow">
+<div class="description"><a class="title optClickTitle" href="https://papers.ssrn.com/sol3/papers.cfm?abstract_id={i}" target="_blank">
+<span>{self.title(i)}</span></a>
+<div class="note">Posted: {self.date(i, 0)}</div>
+<div class="downloads"><span>{self.counts(i)[1]:,}</span> Downloads</div></div></div>"""
+                         for i in ids[(npage - 1) * page_size:npage * page_size])
+        html = f"""<html><head><title>SSRN Section {journal_id}</title></head><body>
+<div class="results-header"><div class="pagination">Page {npage} of <span class="total">{n_total}</span></div></div>
+<div class="tbody">
+{rows}
+</div></body></html>"""
+        return 200, "text/html", html.encode()
+
+    def title(self, i):
+        return f"On the Pricing of Synthetic Asset {i}"
+
+    def date(self, i, months):
+        rng = random.Random(i * 31 + months)
+        return f"{rng.randint(1, 28)} {'Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec'.split()[(i + months) % 12]} " \
+               f"{2005 + (i + months // 12) % 18}"
+
+    def counts(self, i):
+        # views and downloads, the listing pages show the downloads too
+        rng = random.Random(self.seed * 15485863 + i)
+        return rng.randint(0, 200000), rng.randint(0, 50000)
+
+    def paper(self, i):
+        # any abstract_id has a page, eg. the ids hard-coded in scrape_ssrn.py, only the corpus is listed
+        rng = random.Random(self.seed * 7919 + i)
+        authors = [(f"Author {rng.randint(1, 500)}", f"University {rng.randint(1, 90)}")
+                   for _ in range(rng.randint(1, 4))]
+        authors_html = "\n".join(f"<h2><a>{name}</a></h2>\n<p>{university}</p>" for name, university in authors)
+        authors_class = "authors authors-full-width"
+        if self.partial and random.Random(self.seed * 31 + i).random() < self.partial:
+            # a layout the parsers do not know, the universities cannot be read
+            authors_class = "authors authors-compact"
+        title = self.title(i)
+        abstract = " ".join([ABSTRACT_SENTENCE] * rng.randint(2, 12))
+        revised = f"<span>Last revised: {self.date(i, 14)}</span>\n" if rng.random() < 0.6 else ""
+        views, downloads = self.counts(i)
+        if self.drift and i % 3 == 0:
+            epoch = int(time.time() // self.drift)
+            views, downloads = views + 7 * epoch % 100000, downloads + epoch % 10000
+        html = f"""<html><head><title>{title} by {", ".join(name for name, _ in authors)} :: SSRN</title></head><body>
+<div class="header">SSRN</div>
+<div class="container abstract-body">
+<h1>{title}</h1>
+<div class="{authors_class}">
+{authors_html}
+</div>
+<div class="reference-info"><p>Journal of Synthetic Finance, Vol. {i % 60}, No. {i % 4 + 1}</p></div>
+<p class="note note-list"><span>{rng.randint(8, 90)} Pages</span>
+<span>Posted: {self.date(i, 0)}</span>
+{revised}</p>
+<p><strong>Date Written: {self.date(i, -3)}</strong></p>
+<div class="abstract-text"><h3>Abstract</h3>
+<p>We study the pricing of synthetic asset {i}. {abstract}</p></div>
+<div class="box-paper-statics">
+<div class="stat"><span class="lbl">Abstract Views</span>
+<span class="number">{views:,}</span></div>
+<div class="stat"><span class="lbl">Downloads</span>
+<span class="number">{downloads:,}</span></div>
+<div class="stat"><span class="lbl">rank</span>
+<span class="number">{rng.randint(1, 900000):,}</span></div>
+</div>
+<div class="references-citations"><span>References</span>
+<span>{rng.randint(0, 120)}</span></div>
+<div id="citations-widget-abstract" data-url="https://papers.ssrn.com/sol3/citations-widget.cfm?abstract_id={i}"></div>
+</div></body></html>"""
+        return 200, "text/html", html.encode()
+
+    def citations(self, i):
+        rng = random.Random(self.seed * 104729 + i)
+        return 200, "application/json", json.dumps({"total_items": rng.randint(0, 300)}).encode()
+
+
+class FakeSSRN(ThreadingHTTPServer):
+    """
+    HTTP server of the recorded and synthetic pages, one thread per connection, keep-alive
+    """
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 8777), cache_db=None, synthetic=None, latency=0.0, jitter=0.0,
+                 error_rate=0.0, throttle_rate=0.0, soft_block_rate=0.0, drop_rate=0.0, etag=False, quota=None,
+                 seed=None, captcha_rate=0.0):
+        """
+        :param address: (host, port), port 0 picks a free port
+        :param cache_db: str, response cache with the recorded pages, None to only serve the synthetic corpus
+        :param synthetic: SyntheticSSRN, default SyntheticSSRN()
+        :param latency: float, seconds to wait before every answer
+        :param jitter: float, random extra seconds, between 0 and jitter
+        :param error_rate: float, share of the requests answered with a 500 or a 503
+        :param throttle_rate: float, share of the requests answered with a 429
+        :param soft_block_rate: float, share of the requests answered with a soft-block page and a 200
+        :param drop_rate: float, share of the connections closed without an answer
+        :param etag: bool, send an ETag with the pages, and a 304 when If-None-Match matches it
+        :param quota: int, requests of every api_key, then a 403, None for no limit
+        :param seed: int, seed of the faults, None for a random one
+        :param captcha_rate: float, share of the requests answered with a captcha page and a 200,
+                             neither a listing page nor a paper page
+        """
+        super().__init__(address, _Handler)
+        self.cache = ResponseCache(cache_db) if cache_db else None
+        self.synthetic = synthetic if synthetic is not None else SyntheticSSRN()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.soft_block_rate = soft_block_rate
+        self.drop_rate = drop_rate
+        self.captcha_rate = captcha_rate
+        self.etag = etag
+        self.quota = quota
+        self.n_requests_of_key = collections.Counter()
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.n_requests = collections.Counter()
+
+    @property
+    def url(self):
+        """
+        :return: str, eg. http://127.0.0.1:8777
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def draw_fault(self):
+        """
+        :return: None, "drop", "error", "throttle", "soft-block" or "captcha"
+        """
+        with self._lock:
+            draw = self._random.random()
+        for fault, rate in (("drop", self.drop_rate), ("error", self.error_rate),
+                            ("throttle", self.throttle_rate), ("soft-block", self.soft_block_rate),
+                            ("captcha", self.captcha_rate)):
+            if draw < rate:
+                return fault
+            draw -= rate
+        return None
+
+    def over_quota(self, api_key):
+        """
+        :param api_key: str, None for a direct request
+        :return: bool, True if the key used all its requests
+        """
+        if self.quota is None or api_key is None:
+            return False
+        with self._lock:
+            self.n_requests_of_key[api_key] += 1
+            return self.n_requests_of_key[api_key] > self.quota
+
+    def delay(self):
+        """
+        :return: float, seconds to wait before the answer
+        """
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def respond(self, url):
+        """
+        :param url: str, url of the ssrn page
+        :return: status code, content type, body (bytes)
+        """
+        if self.cache is not None:
+            # the pages are recorded with the scheme they were requested with
+            for candidate in (url, url.replace("http://", "https://", 1), url.replace("https://", "http://", 1)):
+                response = self.cache.get(candidate)
+                if response is not None:
+                    content_type = "application/json" if response.content[:1] in (b"{", b"[") else "text/html"
+                    return response.status_code, content_type, response.content
+        return self.synthetic.page(url)
+
+    def count(self, kind, status):
+        with self._lock:
+            self.n_requests[f"{kind} {status}"] += 1
+
+    def stats(self):
+        """
+        :return: dict, "<kind of page> <status code>" ==> number of requests
+        """
+        with self._lock:
+            return dict(sorted(self.n_requests.items()))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, as the real servers
+    protocol_version = "HTTP/1.1"
+
+    def original_url(self):
+        """
+        :return: str, url of the ssrn page asked for, from the url parameter of scraper API
+                 or from the path and the X-Original-Host header of a direct request
+        """
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if "url" in query:
+            return query["url"][0]
+        host = self.headers.get(ORIGINAL_HOST) or "papers.ssrn.com"
+        return urlunsplit(("https", host, parts.path, parts.query, ""))
+
+    def do_GET(self):
+        if self.path == "/__stats__":
+            self.send(200, "application/json", json.dumps(self.server.stats()).encode())
+            return
+
+        url = self.original_url()
+        kind = kind_of_url(url)
+        time.sleep(self.server.delay())
+
+        api_key = parse_qs(urlsplit(self.path).query).get("api_key", [None])[0]
+        if self.server.over_quota(api_key):
+            self.server.count(kind, "over-quota")
+            self.send(403, "text/html", b"<html>You have exhausted the API Credits available in this plan</html>")
+            return
+
+        fault = self.server.draw_fault()
+        if fault == "drop":
+            self.server.count(kind, "dropped")
+            self.close_connection = True
+            return
+        if fault == "error":
+            status, content_type, body = random.choice((500, 503)), "text/html", b"<html>Service Unavailable</html>"
+        elif fault == "throttle":
+            status, content_type, body = 429, "text/html", b"<html>Too Many Requests</html>"
+        elif fault == "soft-block":
+            status, content_type, body = 200, "text/html", NOT_FOUND_PAGE
+        elif fault == "captcha":
+            status, content_type, body = 200, "text/html", CAPTCHA_PAGE
+        else:
+            status, content_type, body = self.server.respond(url)
+
+        headers = {}
+        if self.server.etag and status == 200 and fault is None:
+            headers["ETag"] = '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                status, body = 304, b""
+
+        self.server.count(kind, fault if fault in ("soft-block", "captcha") else status)
+        self.send(status, content_type, body, headers)
+
+    def send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # one line per request would slow down the server
+        pass
+
+
+def start(port=0, **kwargs):
+    """
+    Start a fake server in a background thread, eg. for a benchmark
+
+    :param port: int, 0 picks a free port
+    :param kwargs: arguments of FakeSSRN
+    :return: FakeSSRN, stop it with shutdown()
+    """
+    server = FakeSSRN(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="local stand-in of ssrn and scraper API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8777)
+    parser.add_argument("--cache", default=None, help="response cache with the recorded pages")
+    parser.add_argument("--papers", type=int, default=1000, help="number of synthetic papers")
+    parser.add_argument("--sections", type=int, default=5, help="number of synthetic sections")
+    parser.add_argument("--page-size", type=int, default=20, help="papers per listing page")
+    parser.add_argument("--max-page-size", type=int, default=200, help="largest perpage of a listing page")
+    parser.add_argument("--partial-rate", type=float, default=0.0, help="share of papers with a field that wont parse")
+    parser.add_argument("--cross-listed", type=float, default=0.2, help="share of papers in a second section")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500/503 answers")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of 429 answers")
+    parser.add_argument("--soft-block-rate", type=float, default=0.0, help="share of soft-block pages")
+    parser.add_argument("--captcha-rate", type=float, default=0.0, help="share of captcha pages with a 200")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share of connections closed without answer")
+    parser.add_argument("--drift", type=float, default=0.0, help="seconds between two changes of the counts")
+    parser.add_argument("--etag", action="store_true", help="send an ETag, answer If-None-Match with a 304")
+    parser.add_argument("--quota", type=int, default=None, help="requests of every api_key, then a 403")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    synthetic = SyntheticSSRN(args.papers, args.sections, args.page_size, args.cross_listed, args.seed,
+                               args.drift, args.max_page_size, args.partial_rate)
+    server = FakeSSRN((args.host, args.port), cache_db=args.cache, synthetic=synthetic,
+                      latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                      throttle_rate=args.throttle_rate, soft_block_rate=args.soft_block_rate,
+                      drop_rate=args.drop_rate, etag=args.etag, quota=args.quota,
+                      seed=args.seed, captcha_rate=args.captcha_rate)
+    print(f"fake ssrn on {server.url}, set REPLAY_URL = \"{server.url}\"")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats(), indent=1))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
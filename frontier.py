@@ -0,0 +1,229 @@
+"""
+Cross-section frontier of the papers, keyed by the ssrn abstract_id instead of the url
+- the ids are kept in bitmaps, one bit per id: the 5 million ids of ssrn take 625 KB, less once compressed
+- done: papers fetched (or not found), in this run or a previous one, a paper is fetched once for all sections
+- one bitmap per section tags every paper with all the sections that list it, even if it was fetched for another one
+- the bitmaps are saved (zlib) in SQLite, the papers queued in this run are kept in memory only,
+  a paper queued but not written before a crash is queued again by the next run
+
+"""
+
+import re
+import zlib
+import sqlite3
+import threading
+
+_RE_ABSTRACT_ID = re.compile(r"abstract_id=(\d+)")
+
+
+def abstract_id(url):
+    """
+    :param url: str, eg. https://papers.ssrn.com/sol3/papers.cfm?abstract_id=3999999
+    :return: int, None if the url has no abstract_id
+    """
+    match = _RE_ABSTRACT_ID.search(url)
+    return int(match.group(1)) if match else None
+
+
+class IdSet:
+    """
+    Set of non-negative integers in a bitmap, it grows with the largest id
+    """
+
+    def __init__(self, data=b""):
+        """
+        :param data: bytes, the bitmap, eg. from to_bytes
+        """
+        self._bits = bytearray(data)
+        self._n = self.to_int().bit_count()
+
+    def add(self, i):
+        """
+        :param i: int
+        :return: bool, True if i was not in the set
+        """
+        byte, bit = i >> 3, 1 << (i & 7)
+        if byte >= len(self._bits):
+            # some room ahead, the ids come in no particular order
+            self._bits.extend(bytes(byte + 1 - len(self._bits) + len(self._bits) // 8))
+        if self._bits[byte] & bit:
+            return False
+        self._bits[byte] |= bit
+        self._n += 1
+        return True
+
+    def __contains__(self, i):
+        byte = i >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (i & 7)))
+
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        for byte, value in enumerate(self._bits):
+            if value:
+                for bit in range(8):
+                    if value & (1 << bit):
+                        yield (byte << 3) | bit
+
+    def to_int(self):
+        """
+        :return: int, the bitmap as one integer, bit i is set if i is in the set
+        """
+        return int.from_bytes(self._bits, "little")
+
+    def to_bytes(self):
+        """
+        :return: bytes, the compressed bitmap
+        """
+        return zlib.compress(bytes(self._bits))
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """
+        :param blob: bytes, output of to_bytes
+        :return: IdSet
+        """
+        return cls(zlib.decompress(blob))
+
+
+class Frontier:
+    """
+    Papers done and sections of every paper, shared by all sections
+    """
+
+    def __init__(self, path="ssrn_frontier.db"):
+        """
+        :param path: str, path of the sqlite file, it is created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS bitmaps (
+                name TEXT PRIMARY KEY,
+                bits BLOB NOT NULL
+            )
+        """)
+        bitmaps = {name: IdSet.from_bytes(bits) for name, bits in self._conn.execute("SELECT name, bits FROM bitmaps")}
+
+        self.done = bitmaps.pop("done", IdSet())
+        self.sections = {name[len("section:"):]: ids for name, ids in bitmaps.items() if name.startswith("section:")}
+        # this run only
+        self.queued = IdSet()
+        # the few urls without abstract_id are de-duplicated on the url
+        self._queued_urls = set()
+        self._dirty = set()
+
+    def tag(self, urls, section):
+        """
+        Record that the papers are listed in one section
+
+        :param urls: iterable of paper urls
+        :param section: str, name of the section
+        :return:
+        """
+        with self._lock:
+            ids = self.sections.setdefault(section, IdSet())
+            for url in urls:
+                i = abstract_id(url)
+                if i is not None and ids.add(i):
+                    self._dirty.add("section:" + section)
+
+    def claim(self, url):
+        """
+        Queue a paper if it is new
+
+        :param url: str, paper url
+        :return: bool, True if the paper is neither done nor already queued in this run
+        """
+        i = abstract_id(url)
+        with self._lock:
+            if i is None:
+                if url in self._queued_urls:
+                    return False
+                self._queued_urls.add(url)
+                return True
+            if i in self.done:
+                return False
+            return self.queued.add(i)
+
+    def is_done(self, url):
+        """
+        :param url: str, paper url
+        :return: bool, True if the paper was fetched for any section
+        """
+        i = abstract_id(url)
+        return i is not None and i in self.done
+
+    def is_tagged(self, url, section):
+        """
+        :param url: str, paper url
+        :param section: str
+        :return: bool, True if a listing page of the section already listed the paper
+        """
+        i = abstract_id(url)
+        with self._lock:
+            return i is not None and i in self.sections.get(section, ())
+
+    def mark_done(self, urls):
+        """
+        :param urls: iterable of paper urls, fetched or not found
+        :return:
+        """
+        with self._lock:
+            for url in urls:
+                i = abstract_id(url)
+                if i is not None and self.done.add(i):
+                    self._dirty.add("done")
+
+    def sections_of(self, url):
+        """
+        :param url: str, paper url
+        :return: list of the sections that list the paper
+        """
+        i = abstract_id(url)
+        with self._lock:
+            return [section for section, ids in self.sections.items() if i in ids]
+
+    def iter_tags(self):
+        """
+        :return: generator of (abstract_id, section), by section
+        """
+        for section, ids in list(self.sections.items()):
+            for i in ids:
+                yield i, section
+
+    def save(self):
+        """
+        Write the bitmaps that changed
+        :return:
+        """
+        with self._lock:
+            rows = [(name, (self.done if name == "done" else self.sections[name[len("section:"):]]).to_bytes())
+                    for name in self._dirty]
+            self._dirty.clear()
+            if rows:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT OR REPLACE INTO bitmaps (name, bits) VALUES (?, ?)", rows)
+                self._conn.execute("COMMIT")
+
+    def stats(self):
+        """
+        :return: dict, number of papers done, queued in this run, and tagged in at least 2 sections
+        """
+        with self._lock:
+            # bitwise on the whole bitmaps: ids seen once, ids seen at least twice
+            once, twice = 0, 0
+            for ids in self.sections.values():
+                bits = ids.to_int()
+                twice |= once & bits
+                once |= bits
+            return {"done": len(self.done), "queued": len(self.queued) + len(self._queued_urls),
+                    "tagged": once.bit_count(), "cross_listed": twice.bit_count()}
+
+    def close(self):
+        self.save()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,249 @@
+"""
+Work leases of a distributed crawl in SQLite (WAL mode), shared by one coordinator and several workers
+- the coordinator adds the paper urls, they are split into shards (by abstract_id hash or by section)
+  and cut into batches of one shard
+- a worker leases a batch for some seconds and renews the lease while it works on it,
+  when the lease expires (the worker died, or hangs) the batch goes to the next worker that asks
+- a worker reports the results of a whole batch at once, only if it still holds the lease,
+  so a batch taken over by another worker is never reported twice
+- a batch leased too many times is failed, the next coordinator run queues it again
+- the coordinator reads the results in order, and acknowledges them once they are written
+
+the store is one sqlite file, the workers on other hosts need it on a shared disk,
+the same methods can sit on a server (eg. redis) if the disk is not safe for sqlite locks
+
+"""
+
+import json
+import time
+import sqlite3
+import threading
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class LeaseStore:
+    """
+    Batches of papers, their leases and their results, shared by processes and threads
+    """
+
+    def __init__(self, path="ssrn_leases.db"):
+        """
+        :param path: str, path of the sqlite file, it is created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # the other processes hold the write lock for a few ms, wait for them
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS batches (
+                batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                shard INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                leases INTEGER NOT NULL DEFAULT 0,
+                n_papers INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS batches_status ON batches (status, shard);
+            CREATE TABLE IF NOT EXISTS tasks (
+                url TEXT PRIMARY KEY,
+                section TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                batch_id INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS tasks_batch ON tasks (batch_id);
+            CREATE TABLE IF NOT EXISTS results (
+                result_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch_id INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                section TEXT NOT NULL,
+                payload TEXT NOT NULL
+            );
+        """)
+
+    def add(self, papers, batch_size=100):
+        """
+        Add papers and cut the new ones into batches of one shard
+        - a paper already in a pending, leased or failed batch is left there
+        - a paper of a done batch whose result was written is added again: the caller passes only the papers
+          that are not finished, it failed in that batch (or its result was lost) and is batched once more
+
+        :param papers: iterable of (url, section, shard)
+        :param batch_size: int, max number of papers in one batch
+        :return: int, number of papers batched, new or added again
+        """
+        papers = list(papers)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("INSERT OR IGNORE INTO tasks (url, section, shard) VALUES (?, ?, ?)", papers)
+                self._conn.executemany(
+                    "UPDATE tasks SET batch_id = NULL WHERE url = ? "
+                    "AND batch_id IN (SELECT batch_id FROM batches WHERE status = ?) "
+                    "AND url NOT IN (SELECT url FROM results)",
+                    ((url, DONE) for url, section, shard in papers))
+                rows = self._conn.execute("SELECT url, shard FROM tasks WHERE batch_id IS NULL "
+                                          "ORDER BY shard, rowid").fetchall()
+
+                by_shard = {}
+                for url, shard in rows:
+                    by_shard.setdefault(shard, []).append(url)
+                for shard, urls in by_shard.items():
+                    for i in range(0, len(urls), batch_size):
+                        batch = urls[i:i + batch_size]
+                        batch_id = self._conn.execute("INSERT INTO batches (shard, n_papers) VALUES (?, ?)",
+                                                      (shard, len(batch))).lastrowid
+                        self._conn.executemany("UPDATE tasks SET batch_id = ? WHERE url = ?",
+                                               ((batch_id, url) for url in batch))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def expire(self, max_leases):
+        """
+        Fail the batches whose lease expired and that were leased max_leases times already
+
+        :param max_leases: int
+        :return: int, number of batches failed
+        """
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE batches SET status = ?, worker = NULL WHERE status = ? AND lease_until < ? AND leases >= ?",
+                (FAILED, LEASED, time.time(), max_leases)).rowcount
+
+    def lease(self, worker, lease_seconds=300, shards=None, max_leases=5):
+        """
+        Lease the oldest batch that is pending, or whose lease expired
+
+        :param worker: str, name of the worker, eg. host-pid
+        :param lease_seconds: float, the batch goes to another worker if the lease is not renewed in time
+        :param shards: list of int, only lease batches of these shards, None for all
+        :param max_leases: int, a batch leased that many times is failed instead
+        :return: batch_id, list of (url, section), None if there is nothing to lease
+        """
+        self.expire(max_leases)
+        now = time.time()
+        query = "SELECT batch_id FROM batches WHERE (status = ? OR (status = ? AND lease_until < ?))"
+        if shards is not None:
+            query += " AND shard IN ({})".format(",".join("?" * len(shards)))
+        query += " ORDER BY batch_id LIMIT 1"
+
+        with self._lock:
+            # one writer at a time, two workers never take the same batch
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(query, (PENDING, LEASED, now, *(shards or ()))).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                batch_id = row[0]
+                self._conn.execute("UPDATE batches SET status = ?, worker = ?, lease_until = ?, leases = leases + 1 "
+                                   "WHERE batch_id = ?", (LEASED, worker, now + lease_seconds, batch_id))
+                papers = self._conn.execute("SELECT url, section FROM tasks WHERE batch_id = ? ORDER BY rowid",
+                                            (batch_id,)).fetchall()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return batch_id, papers
+
+    def renew(self, batch_ids, worker, lease_seconds=300):
+        """
+        Extend the leases a worker still holds
+
+        :param batch_ids: iterable of int
+        :param worker: str
+        :param lease_seconds: float
+        :return: list of the batch_ids whose lease was renewed, the others were taken over
+        """
+        renewed = []
+        until = time.time() + lease_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for batch_id in batch_ids:
+                if self._conn.execute("UPDATE batches SET lease_until = ? WHERE batch_id = ? AND status = ? "
+                                      "AND worker = ?", (until, batch_id, LEASED, worker)).rowcount:
+                    renewed.append(batch_id)
+            self._conn.execute("COMMIT")
+        return renewed
+
+    def complete(self, batch_id, worker, results):
+        """
+        Report the results of a whole batch, and release it
+
+        :param batch_id: int
+        :param worker: str
+        :param results: list of (url, section, payload), payload is anything json can write
+        :return: bool, False if the worker lost the lease, the results are dropped
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # the lease may have expired, it still counts if no other worker took the batch
+                owned = self._conn.execute("UPDATE batches SET status = ?, worker = NULL WHERE batch_id = ? "
+                                           "AND status = ? AND worker = ?",
+                                           (DONE, batch_id, LEASED, worker)).rowcount
+                if owned:
+                    self._conn.executemany(
+                        "INSERT INTO results (batch_id, url, section, payload) VALUES (?, ?, ?, ?)",
+                        ((batch_id, url, section, json.dumps(payload)) for url, section, payload in results))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return bool(owned)
+
+    def iter_results(self, after=0, limit=1000):
+        """
+        :param after: int, result_id of the last result read
+        :param limit: int, max number of results
+        :return: list of (result_id, url, section, payload), in the order they were reported
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT result_id, url, section, payload FROM results WHERE result_id > ? "
+                                      "ORDER BY result_id LIMIT ?", (after, limit)).fetchall()
+        return [(result_id, url, section, json.loads(payload)) for result_id, url, section, payload in rows]
+
+    def ack(self, up_to):
+        """
+        Delete the results that are written
+
+        :param up_to: int, result_id of the last result written
+        :return:
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE result_id <= ?", (up_to,))
+
+    def requeue_failed(self):
+        """
+        :return: int, number of failed batches queued again
+        """
+        with self._lock:
+            return self._conn.execute("UPDATE batches SET status = ?, leases = 0 WHERE status = ?",
+                                      (PENDING, FAILED)).rowcount
+
+    def counts(self):
+        """
+        :return: dict, number of batches for every status
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM batches GROUP BY status").fetchall())
+
+    def is_finished(self):
+        """
+        :return: bool, True if no batch is pending or leased
+        """
+        counts = self.counts()
+        return not counts.get(PENDING) and not counts.get(LEASED)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,424 @@
+"""
+Metrics of the crawl: counters, gauges and latency histograms, shared by all threads
+- requests by kind of page and status code, request latency, bytes received, cache hits
+- retries and items given up by error class, parse time per page, write time per batch
+- queue depths of the stages, concurrency limit and requests in flight of the rate controller
+- exposed in the Prometheus text format on http://127.0.0.1:{port}/metrics (json on /metrics.json),
+  or written as a json snapshot to a file every few seconds, with a summary:
+  network-bound ==> the requests in flight stay at the concurrency limit and the request latency is high
+  proxy-bound ==> many 429/5xx/soft blocks, the concurrency limit keeps being cut
+  cpu-bound ==> the parsers are busy all the time, the parse queue grows
+- the metrics of the parsers running in other processes come back with their results, see timed()
+
+"""
+
+import os
+import json
+import time
+import bisect
+import functools
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# seconds, upper bounds of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 70.0)
+
+_lock = threading.Lock()
+_metrics = []
+_start_time = time.time()
+
+
+class _Metric:
+
+    def __init__(self, name, documentation, labels=()):
+        """
+        :param name: str, eg. ssrn_requests_total
+        :param documentation: str, one line
+        :param labels: tuple of the names of the labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        with _lock:
+            _metrics.append(self)
+
+    def _label_text(self, values, extra=""):
+        pairs = [f'{name}="{value}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _key(self, values):
+        return "|".join(str(value) for value in values) if values else ""
+
+
+class Counter(_Metric):
+    """
+    Value that only goes up, eg. number of requests
+    """
+    type = "counter"
+
+    def inc(self, *values, amount=1):
+        """
+        :param values: values of the labels, in order
+        :param amount: number added
+        :return:
+        """
+        with _lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def get(self, *values):
+        with _lock:
+            return self._values.get(values, 0)
+
+    def total(self):
+        with _lock:
+            return sum(self._values.values())
+
+    def samples(self):
+        with _lock:
+            return [(self.name + self._label_text(values), value) for values, value in sorted(self._values.items())]
+
+    def snapshot(self):
+        with _lock:
+            return {self._key(values): value for values, value in sorted(self._values.items())}
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down, eg. queue depth, or read from a function when the metrics are exported
+    """
+    type = "gauge"
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._functions = {}
+
+    def set(self, value, *values):
+        """
+        :param value: float
+        :param values: values of the labels, in order
+        :return:
+        """
+        with _lock:
+            self._values[values] = value
+
+    def set_function(self, function, *values):
+        """
+        :param function: function without argument that returns the value, eg. lambda: len(queue)
+        :param values: values of the labels, in order
+        :return:
+        """
+        with _lock:
+            self._functions[values] = function
+
+    def _read_functions(self):
+        with _lock:
+            functions = list(self._functions.items())
+        for values, function in functions:
+            try:
+                value = function()
+            except Exception:
+                continue
+            with _lock:
+                self._values[values] = value
+
+    def samples(self):
+        self._read_functions()
+        return super().samples()
+
+    def snapshot(self):
+        self._read_functions()
+        return super().snapshot()
+
+
+class Histogram(_Metric):
+    """
+    Distribution of a duration, in cumulative buckets as Prometheus does
+    """
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *values):
+        """
+        :param value: float, eg. seconds
+        :param values: values of the labels, in order
+        :return:
+        """
+        i = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            counts = self._values.get(values)
+            if counts is None:
+                # one count per bucket, +Inf last, then the sum of the values
+                counts = self._values[values] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def count(self, *values):
+        with _lock:
+            counts = self._values.get(values)
+            return sum(counts[:-1]) if counts else 0
+
+    def sum(self, *values):
+        with _lock:
+            counts = self._values.get(values)
+            return counts[-1] if counts else 0.0
+
+    def samples(self):
+        samples = []
+        with _lock:
+            items = sorted((values, list(counts)) for values, counts in self._values.items())
+        for values, counts in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts[:-1]):
+                cumulative += n
+                samples.append((self.name + "_bucket" + self._label_text(values, f'le="{bound}"'), cumulative))
+            samples.append((self.name + "_count" + self._label_text(values), cumulative))
+            samples.append((self.name + "_sum" + self._label_text(values), round(counts[-1], 6)))
+        return samples
+
+    def snapshot(self):
+        with _lock:
+            items = sorted((values, list(counts)) for values, counts in self._values.items())
+        res = {}
+        for values, counts in items:
+            n = sum(counts[:-1])
+            res[self._key(values)] = {"count": n, "sum": round(counts[-1], 3),
+                                      "mean": round(counts[-1] / n, 4) if n else None,
+                                      "p50": self._quantile(counts, 0.5), "p95": self._quantile(counts, 0.95)}
+        return res
+
+    def _quantile(self, counts, q):
+        # upper bound of the bucket of the quantile
+        n = sum(counts[:-1])
+        if n == 0:
+            return None
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts[:-1]):
+            cumulative += count
+            if cumulative >= q * n:
+                return bound
+        return None
+
+
+"""
+metrics of the crawl
+"""
+REQUESTS = Counter("ssrn_requests_total", "requests sent, by kind of page and status code (error: no answer)",
+                   ("kind", "status"))
+REQUEST_SECONDS = Histogram("ssrn_request_seconds", "latency of the requests, by kind of page", ("kind",))
+RESPONSE_BYTES = Counter("ssrn_response_bytes_total", "bytes of the bodies received, by kind of page", ("kind",))
+CACHE_HITS = Counter("ssrn_cache_hits_total", "pages read from the response cache, by kind of page", ("kind",))
+RETRIES = Counter("ssrn_retries_total", "items tried again, by error class", ("error_class",))
+GIVEN_UP = Counter("ssrn_given_up_total", "items given up after the retries, by error class", ("error_class",))
+PARSE_SECONDS = Histogram("ssrn_parse_seconds", "time to parse one page, by kind of page", ("kind",))
+WRITE_SECONDS = Histogram("ssrn_write_seconds", "time to write one batch, records or crawl state", ("step",))
+RECORDS_WRITTEN = Counter("ssrn_records_written_total", "records written, by output format", ("format",))
+QUEUE_DEPTH = Gauge("ssrn_queue_depth", "items waiting or running, by queue or stage", ("queue",))
+CONCURRENCY = Gauge("ssrn_concurrency", "concurrency limit of the rate controller and requests in flight",
+                    ("value",))
+ENDPOINT = Gauge("ssrn_endpoint", "health, latency (s), concurrency limit, requests in flight and down (1) "
+                 "of every endpoint", ("endpoint", "value"))
+
+
+def kind_of_url(url):
+    """
+    :param url: str, url of the ssrn page
+    :return: str, "paper", "listing", "citations", "subject-areas", "topic" or "other"
+    """
+    path = urlsplit(url).path.lower()
+    if path.endswith("/papers.cfm"):
+        return "paper"
+    if path.endswith("/jeljour_results.cfm"):
+        return "listing"
+    if "citations-widget" in path:
+        return "citations"
+    if "subject-areas" in path:
+        return "subject-areas"
+    if path.startswith("/index.cfm/en/"):
+        return "topic"
+    return "other"
+
+
+def observe_request(url, response, seconds):
+    """
+    Record one request
+
+    :param url: str, url of the ssrn page
+    :param response: response of requests or httpx, None if the connection failed
+    :param seconds: float, time of the request
+    :return:
+    """
+    kind = kind_of_url(url)
+    REQUESTS.inc(kind, "error" if response is None else response.status_code)
+    REQUEST_SECONDS.observe(seconds, kind)
+    if response is not None:
+        RESPONSE_BYTES.inc(kind, amount=len(response.content))
+
+
+def timed(func, *args, **kwargs):
+    """
+    Call func and measure it, eg. in a parser process: the time comes back with the result
+    and is recorded by the main process
+
+    :return: result of func, seconds
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def track_rate_controller(controller):
+    """
+    Read the concurrency limit and the requests in flight of a rate controller when the metrics are exported
+
+    :param controller: rate_control.RateController or AsyncRateController
+    :return:
+    """
+    CONCURRENCY.set_function(lambda: controller.limit, "limit")
+    CONCURRENCY.set_function(lambda: controller.in_flight, "in_flight")
+
+
+def track_endpoint_pool(pool):
+    """
+    Read the scores and the limits of every endpoint when the metrics are exported
+
+    :param pool: endpoints.EndpointPool
+    :return:
+    """
+    for endpoint in pool.endpoints:
+        for value, read in (("health", lambda e: e.health), ("latency", lambda e: e.latency or 0.0),
+                            ("limit", lambda e: e.controller.limit), ("in_flight", lambda e: e.controller.in_flight),
+                            ("down", lambda e: float(not e.is_up(time.monotonic())))):
+            ENDPOINT.set_function(functools.partial(read, endpoint), endpoint.name, value)
+
+
+def render():
+    """
+    :return: str, all metrics in the Prometheus text format
+    """
+    with _lock:
+        metrics = list(_metrics)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(f"{name} {value}" for name, value in metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def summary():
+    """
+    A few numbers derived from the metrics, to see what limits the crawl
+
+    :return: dict
+    """
+    elapsed = time.time() - _start_time
+    n_requests = REQUESTS.total()
+    with _lock:
+        n_throttled = sum(n for (kind, status), n in REQUESTS._values.items() if status in (403, 429) or
+                          (isinstance(status, int) and status >= 500))
+    n_seconds = sum(REQUEST_SECONDS.sum(kind) for kind in ("paper", "listing", "citations"))
+    n_timed = sum(REQUEST_SECONDS.count(kind) for kind in ("paper", "listing", "citations"))
+    parse_seconds = sum(PARSE_SECONDS.sum(kind) for kind in ("paper", "listing"))
+    return {
+        "elapsed_seconds": round(elapsed, 1),
+        "requests_per_second": round(n_requests / elapsed, 2) if elapsed else None,
+        "mean_request_seconds": round(n_seconds / n_timed, 4) if n_timed else None,
+        "throttled_share": round(n_throttled / n_requests, 4) if n_requests else None,
+        # seconds of parsing per second of crawl, compare it with NUM_PARSERS
+        "parsers_busy": round(parse_seconds / elapsed, 2) if elapsed else None,
+        "mb_received": round(RESPONSE_BYTES.total() / 1024 ** 2, 2),
+    }
+
+
+def snapshot():
+    """
+    :return: dict, all metrics and the summary, for json
+    """
+    with _lock:
+        metrics = list(_metrics)
+    res = {"time": round(time.time(), 3), "summary": summary()}
+    res.update({metric.name: metric.snapshot() for metric in metrics})
+    return res
+
+
+def write_snapshot(path):
+    """
+    :param path: str, json file, it is replaced at every call
+    :return:
+    """
+    with open(path + ".tmp", 'w', encoding="utf-8") as file:
+        json.dump(snapshot(), file, indent=1, default=str)
+    os.replace(path + ".tmp", path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body, content_type = json.dumps(snapshot(), default=str).encode(), "application/json"
+        elif self.path.startswith("/metrics"):
+            body, content_type = render().encode(), "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_snapshots = None
+
+
+def serve(port=9100, host="127.0.0.1"):
+    """
+    Export the metrics on http://{host}:{port}/metrics, in a background thread, once per process
+
+    :param port: int
+    :param host: str
+    :return: ThreadingHTTPServer
+    """
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _Handler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+def write_snapshots(path, interval=10.0):
+    """
+    Write a json snapshot to path every interval seconds, in a background thread, once per process
+
+    :param path: str, eg. ssrn_metrics.json
+    :param interval: float, seconds
+    :return:
+    """
+    global _snapshots
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot(path)
+            except OSError as er:
+                print(f"metrics snapshot: {er}")
+
+    with _lock:
+        if _snapshots is None:
+            _snapshots = threading.Thread(target=loop, daemon=True)
+            _snapshots.start()
@@ -0,0 +1,509 @@
+"""
+Parsers of the ssrn pages, with two backends
+- "bs4": BeautifulSoup with html.parser, pure python, it builds the whole tree and the whole page text
+- "lxml": C-backed lxml tree, the fields are read with targeted XPath selectors,
+          the page text is streamed line by line and only until the "Date Written" line
+- a field that does not parse is left empty and named in `missing`, the other fields of the page are kept
+- both backends return the same fields, run this file on saved pages to compare them:
+      python parsers.py saved_pages/*.html
+
+"""
+
+import re
+import sys
+import json
+
+from bs4 import BeautifulSoup
+from ordered_set import OrderedSet
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:
+    etree = None
+
+"""
+PARSER SETTINGS
+- BACKEND --> "lxml" (fast, needs lxml installed) or "bs4"
+"""
+BACKEND = "lxml" if etree is not None else "bs4"
+
+# names of the fields returned by parse_paper
+FIELDS = ["url", "title", "abstract", "authors", "journal", "date", "universities",
+          "views", "downloads", "rank", "n_refs", "n_cit"]
+
+
+def parse_n_citations(content):
+    """
+    find the number of citations in the response of the citation widget, it is json, no need of a html parser
+
+    :param content: bytes or str, body of the response
+    :return: int
+    """
+    return int(json.loads(content)["total_items"])
+
+
+def empty_results(url):
+    """
+    :param url: str, url of the paper
+    :return: list of results of a paper that did not work, only the url is filled
+    """
+    return [url] + [""] * (len(FIELDS) - 1)
+
+
+def _field(missing, name, find, default=""):
+    """
+    :param missing: list, the name of the field is appended to it if find fails, None to let the error through
+    :param name: str, name of the field, see FIELDS
+    :param find: function without argument, return the value of the field
+    :param default: value of the field if find fails
+    :return: value of the field
+    """
+    if missing is None:
+        return find()
+    try:
+        return find()
+    except Exception:
+        missing.append(name)
+        return default
+
+
+def is_empty(results):
+    """
+    :param results: list of results
+    :return: bool, True if there is neither title nor abstract
+    """
+    return not results[1] and not results[2]
+
+
+def parse_paper(content, url, backend=None, missing=None):
+    """
+    find relevant info in the html of one paper page
+
+    :param content: bytes or str, html of the paper page
+    :param url: str, url of the paper
+    :param backend: "lxml" or "bs4", default BACKEND
+    :param missing: list, the names of the fields that did not parse are appended to it, they are left empty,
+                    None to raise on the first one
+    :return: list of results, link of the citation widget (None if not found)
+    """
+    backend = backend or BACKEND
+    if backend == "lxml":
+        return find_info_in_tree(parse_tree(content), url, missing)
+    return find_info_in_soup(BeautifulSoup(content, "html.parser"), url, missing)
+
+
+def parse_listing(content, get_total=False, backend=None, hints=None):
+    """
+    find the urls of all papers in the html of one listing page
+
+    :param content: bytes or str, html of the listing page
+    :param get_total: bool, also return the total number of pages
+    :param backend: "lxml" or "bs4", default BACKEND
+    :param hints: dict, filled with url ==> (date posted, downloads) shown in the row of every paper, None to skip
+    :return:
+    """
+    backend = backend or BACKEND
+    if backend == "lxml":
+        return find_lst_paper_in_tree(parse_tree(content), get_total, hints)
+    return find_lst_paper_in_soup(BeautifulSoup(content, "html.parser"), get_total, hints)
+
+
+def row_hints(text):
+    """
+    find what the row of a paper in a listing page tells before the paper is requested
+
+    :param text: str, text of the row, eg. "... Posted: 10 Jan 2013 ... 1,234 Downloads"
+    :return: date posted, downloads, str, "" if the row does not show it
+    """
+    posted = re.search(r"Posted:\s*(\d{1,2} \w+ \d{4})", text)
+    downloads = re.search(r"([\d,]+)\s+Downloads|Downloads:?\s*([\d,]+)", text)
+    return (posted.group(1) if posted else "",
+            (downloads.group(1) or downloads.group(2)) if downloads else "")
+
+
+"""
+bs4 backend
+"""
+
+
+def find_info_in_soup(soup, url, missing=None):
+    """
+    find relevant info in the soup of one paper,
+    the number of citations is left empty, it needs another request to the citation widget
+
+    :param soup: soup of the paper page
+    :param url: str, url of the paper
+    :param missing: list, the names of the fields that did not parse are appended to it, see parse_paper
+    :return: list of results, link of the citation widget (None if not found)
+    """
+    # the main body
+    body = soup.find(class_="container abstract-body")
+
+    # the list of text
+    text_list = OrderedSet(soup.get_text().split("\n")) - {''}
+
+    # find title
+    title = _field(missing, "title", lambda: body.find('h1').get_text().replace("\n", ""))
+
+    # find author
+    authors = _field(missing, "authors",
+                     lambda: text_list[0].replace(title, "").replace(" :: SSRN", "").replace(" by ", ""))
+
+    # find abstract
+    abstract = _field(missing, "abstract", lambda: body.find(class_="abstract-text").get_text()
+                      .replace("\n", "").replace("Abstract", ""))
+
+    # find journal
+    def find_journal():
+        if body.find(class_="reference-info"):
+            return body.find(class_="reference-info").get_text().replace("\n", "")
+        return " "
+    journal = _field(missing, "journal", find_journal)
+
+    # find date ==> post date, last revisit date
+    def find_date():
+        date = body.find(class_="note note-list").get_text().replace("\n", ", ")
+        if "Pages" in date:
+            date = date.split("Pages, ")[1]
+        else:
+            date = date.replace(", ", "")
+
+        # find date ==> writen day
+        date_written = [line for line in text_list if "Date Written" in line]
+        if len(date_written) > 0:
+            date_written = date_written[0]
+        return date + str(date_written)
+    date = _field(missing, "date", find_date)
+
+    # find university
+    def find_universities():
+        universities = body.find(class_="authors authors-full-width").find_all("p")
+        universities = [university.get_text() for university in universities]
+
+        # convert list to string with "," as seperator
+        return ",".join(universities)
+    universities = _field(missing, "universities", find_universities)
+
+    # find paper statistics, a new paper may have none
+    try:
+        stats = OrderedSet(body.find('div', attrs={'class': 'box-paper-statics'}).get_text().split("\n"))
+    except Exception:
+        stats = OrderedSet()
+
+    views, dl, rank, n_refs, n_cit = "", "", "", "", ""
+    try:
+        views = stats[stats.index('Abstract Views') + 1].strip().replace(",", "")
+    except Exception:
+        pass
+
+    try:
+        dl = stats[stats.index('Downloads') + 1].strip().replace(",", "")
+    except Exception:
+        pass
+
+    try:
+        rank = stats[stats.index('rank') + 1].strip().replace(",", "")
+    except Exception:
+        pass
+
+    # reference
+    try:
+        refs = body.find(class_="references-citations").get_text().split()
+        n_refs = [n for n in refs if n.isdigit()][0]
+    except Exception:
+        pass
+
+    # citations ==> return a link
+    cit = None
+    try:
+        cit = body.find(id="citations-widget-abstract")["data-url"]
+    except Exception:
+        pass
+
+    # combine all results
+    results = [url, title, abstract, authors, journal, date, universities, views, dl, rank, n_refs, n_cit]
+    return results, cit
+
+
+def find_n_citations(soup_cit):
+    """
+    find the number of citations in the response of the citation widget
+
+    :param soup_cit: soup of the citation widget, its text is json
+    :return: str
+    """
+    return str(parse_n_citations(soup_cit.get_text()))
+
+
+def find_lst_paper_in_soup(soup, get_total=False, hints=None):
+    """
+    find the urls of all papers in the soup of one listing page
+
+    :param soup: soup of the listing page
+    :param get_total: bool, also return the total number of pages
+    :param hints: dict, filled with url ==> (date posted, downloads), see row_hints, None to skip
+    :return:
+    """
+    # find the body that contains all url
+    body = soup.find(class_="tbody")
+
+    # find the urls
+    title_url = body.find_all(class_="title optClickTitle", href=True)
+
+    # transform into list
+    lst_title_url = [i["href"] for i in title_url]
+
+    if hints is not None:
+        for link in title_url:
+            row = link.find_parent(class_="trow")
+            if row is not None:
+                hints[link["href"]] = row_hints(row.get_text(" "))
+
+    # get total number of pages
+    if get_total:
+        if soup.find(class_="results-header").find(class_="total"):
+            n_total = soup.find(class_="results-header").find(class_="total").get_text()
+        else:
+            # may not one page
+            n_total = 1
+        return lst_title_url, n_total
+    else:
+        return lst_title_url
+
+
+"""
+lxml backend
+same fields as the bs4 backend, the selectors follow the BeautifulSoup calls:
+- find(class_="a b") matches the whole class attribute
+- find(class_="a") matches one of the classes
+"""
+
+
+def parse_tree(content):
+    """
+    :param content: bytes or str, html
+    :return: root element of the lxml tree
+    """
+    if etree is None:
+        raise ImportError('BACKEND = "lxml" needs lxml, run: pip install lxml')
+    return lxml_html.document_fromstring(content)
+
+
+def _has_class(name):
+    # xpath condition, true if one of the classes of the element is name
+    return "contains(concat(' ', normalize-space(@class), ' '), ' {} ')".format(name)
+
+
+def _first(element, xpath):
+    res = element.xpath(xpath)
+    return res[0] if res else None
+
+
+def _string(text, keep):
+    # BeautifulSoup keeps a text node of whitespace only as one line break (or one space), unless keep
+    if keep or text.strip(" \n\t\f\r"):
+        return text
+    return "\n" if "\n" in text else " "
+
+
+def _text(element):
+    # same as get_text() in BeautifulSoup, the text of script and style is left out
+    keep = any(parent.tag in ("pre", "textarea") for parent in element.iterancestors())
+    return "".join(_iter_texts(element, keep, tail=False))
+
+
+def _iter_texts(element, keep=False, tail=True):
+    # text nodes in document order, without comments, script and style, keep: in pre or textarea
+    if isinstance(element.tag, str) and element.tag not in ("script", "style"):
+        keep_inside = keep or element.tag in ("pre", "textarea")
+        if element.text:
+            yield _string(element.text, keep_inside)
+        for child in element:
+            yield from _iter_texts(child, keep_inside)
+    if tail and element.tail and element.getparent() is not None:
+        yield _string(element.tail, keep)
+
+
+def iter_lines(root):
+    """
+    read the lines of the page text lazily, same as get_text().split("\\n") in BeautifulSoup
+
+    :param root: lxml element
+    :return: generator of str
+    """
+    line = []
+    for text in _iter_texts(root):
+        parts = text.split("\n")
+        line.append(parts[0])
+        for part in parts[1:]:
+            yield "".join(line)
+            line = [part]
+    yield "".join(line)
+
+
+def find_info_in_tree(root, url, missing=None):
+    """
+    find relevant info in the lxml tree of one paper,
+    the number of citations is left empty, it needs another request to the citation widget
+
+    :param root: lxml root element of the paper page
+    :param url: str, url of the paper
+    :param missing: list, the names of the fields that did not parse are appended to it, see parse_paper
+    :return: list of results, link of the citation widget (None if not found)
+    """
+    # the main body
+    body = _first(root, '//*[@class="container abstract-body"]')
+
+    # find title
+    title = _field(missing, "title", lambda: _text(_first(body, './/h1')).replace("\n", ""))
+
+    # find author ==> the first line of the page, and the date written ==> the first line with "Date Written"
+    # the lines are read until "Date Written" is found, the page text is never built
+    first_line = None
+    date_written = []
+    for line in iter_lines(root):
+        if first_line is None and line != '':
+            first_line = line
+        if "Date Written" in line:
+            date_written = line
+            break
+    authors = _field(missing, "authors",
+                     lambda: first_line.replace(title, "").replace(" :: SSRN", "").replace(" by ", ""))
+
+    # find abstract
+    abstract = _field(missing, "abstract",
+                      lambda: _text(_first(body, './/*[{}]'.format(_has_class("abstract-text"))))
+                      .replace("\n", "").replace("Abstract", ""))
+
+    # find journal
+    def find_journal():
+        reference_info = _first(body, './/*[{}]'.format(_has_class("reference-info")))
+        if reference_info is not None:
+            return _text(reference_info).replace("\n", "")
+        return " "
+    journal = _field(missing, "journal", find_journal)
+
+    # find date ==> post date, last revisit date
+    def find_date():
+        date = _text(_first(body, './/*[@class="note note-list"]')).replace("\n", ", ")
+        if "Pages" in date:
+            date = date.split("Pages, ")[1]
+        else:
+            date = date.replace(", ", "")
+        return date + str(date_written)
+    date = _field(missing, "date", find_date)
+
+    # find university
+    def find_universities():
+        universities = _first(body, './/*[@class="authors authors-full-width"]').xpath('.//p')
+        universities = [_text(university) for university in universities]
+
+        # convert list to string with "," as seperator
+        return ",".join(universities)
+    universities = _field(missing, "universities", find_universities)
+
+    # find paper statistics, a new paper may have none
+    try:
+        stats = OrderedSet(_text(_first(body, './/div[{}]'.format(_has_class("box-paper-statics")))).split("\n"))
+    except Exception:
+        stats = OrderedSet()
+
+    views, dl, rank, n_refs, n_cit = "", "", "", "", ""
+    try:
+        views = stats[stats.index('Abstract Views') + 1].strip().replace(",", "")
+    except Exception:
+        pass
+
+    try:
+        dl = stats[stats.index('Downloads') + 1].strip().replace(",", "")
+    except Exception:
+        pass
+
+    try:
+        rank = stats[stats.index('rank') + 1].strip().replace(",", "")
+    except Exception:
+        pass
+
+    # reference
+    try:
+        refs = _text(_first(body, './/*[{}]'.format(_has_class("references-citations")))).split()
+        n_refs = [n for n in refs if n.isdigit()][0]
+    except Exception:
+        pass
+
+    # citations ==> return a link
+    cit = _first(body, './/*[@id="citations-widget-abstract"]/@data-url') if body is not None else None
+    cit = str(cit) if cit is not None else None
+
+    # combine all results
+    results = [url, title, abstract, authors, journal, date, universities, views, dl, rank, n_refs, n_cit]
+    return results, cit
+
+
+def find_lst_paper_in_tree(root, get_total=False, hints=None):
+    """
+    find the urls of all papers in the lxml tree of one listing page
+
+    :param root: lxml root element of the listing page
+    :param get_total: bool, also return the total number of pages
+    :param hints: dict, filled with url ==> (date posted, downloads), see row_hints, None to skip
+    :return:
+    """
+    # find the body that contains all url, then the urls
+    body = _first(root, '//*[{}]'.format(_has_class("tbody")))
+    lst_title_url = [str(href) for href in body.xpath('.//*[@class="title optClickTitle"]/@href')]
+
+    if hints is not None:
+        for link in body.xpath('.//*[@class="title optClickTitle"][@href]'):
+            row = _first(link, 'ancestor::*[{}][1]'.format(_has_class("trow")))
+            if row is not None:
+                hints[str(link.get("href"))] = row_hints(" ".join(row.xpath(".//text()")))
+
+    # get total number of pages
+    if get_total:
+        header = _first(root, '//*[{}]'.format(_has_class("results-header")))
+        total = _first(header, './/*[{}]'.format(_has_class("total")))
+        if total is not None:
+            n_total = _text(total)
+        else:
+            # may not one page
+            n_total = 1
+        return lst_title_url, n_total
+    else:
+        return lst_title_url
+
+
+def compare_backends(paths):
+    """
+    parse saved paper pages with both backends, and print the fields that differ
+
+    :param paths: list of paths of html files
+    :return: int, number of pages with a difference
+    """
+    n_diff = 0
+    for path in paths:
+        with open(path, 'rb') as file:
+            content = file.read()
+
+        missing_bs4, missing_lxml = [], []
+        res_bs4 = parse_paper(content, path, backend="bs4", missing=missing_bs4)
+        res_lxml = parse_paper(content, path, backend="lxml", missing=missing_lxml)
+
+        diff = [(name, a, b) for name, a, b in zip(FIELDS + ["citation_url", "missing"],
+                                                   res_bs4[0] + [res_bs4[1], missing_bs4],
+                                                   res_lxml[0] + [res_lxml[1], missing_lxml]) if a != b]
+        if diff:
+            n_diff += 1
+            print("-" * 80)
+            print(path)
+            for name, a, b in diff:
+                print(f"{name}: bs4 {a!r} != lxml {b!r}")
+
+    print(f"{len(paths)} pages compared, {n_diff} with a difference")
+    return n_diff
+
+
+if __name__ == "__main__":
+
+    # compare both backends on saved paper pages
+    sys.exit(1 if compare_backends(sys.argv[1:]) else 0)
@@ -0,0 +1,165 @@
+"""
+Bounded producer/consumer pipeline on thread and process pools
+- the items are read lazily from any iterable (eg. the lines of a url list file)
+- at most max_pending items are submitted at a time, a new one is submitted only when one completes
+- the results are yielded as they complete, so the caller can write and release them
+  ==> peak memory depends on the concurrency, not on the number of items
+- staged_map splits the work into stages with their own pools, eg. network on threads, parsing on processes
+- failed items are tried again after a backoff delay (see retry.py), without holding a worker while they wait
+- a WorkQueue can be fed while the map runs, eg. the papers found in a listing page are queued right away
+
+"""
+
+import time
+import heapq
+import itertools
+import concurrent.futures
+
+import metrics
+
+from retry import DelayQueue
+
+
+def bounded_map(func, iterable, max_workers, max_pending=None, retry=None):
+    """
+    Apply func to every item of iterable with a pool of max_workers threads,
+    yield (item, result) in the order the items complete
+
+    :param func: function of one item
+    :param iterable: iterable of items, it is consumed lazily
+    :param max_workers: int, number of threads
+    :param max_pending: int, max number of submitted items not yet yielded, default 2 * max_workers
+    :param retry: function (item, result, attempts) ==> seconds to wait before trying the item again,
+                  None to keep the result, eg. retry.Retrier, None to never retry
+    :return: generator of (item, result)
+    """
+    return staged_map([(func, "thread", max_workers)], iterable, max_pending, retry)
+
+
+def staged_map(stages, iterable, max_pending=None, retry=None):
+    """
+    Run every item of iterable through a chain of stages, each stage has its own pool,
+    eg. fetch on threads ==> parse on processes ==> fetch the citations on threads
+    the result of one stage is the argument of the next one,
+    yield (item, result of the last stage) in the order the items complete
+
+    a failed item goes back to the first stage after the delay given by retry,
+    it waits in a delay queue and does not hold a worker, the workers take fresh items in the meantime
+
+    :param stages: list of (func, kind, max_workers), kind is "thread" or "process",
+                   the functions of a "process" stage must be picklable (defined at module level)
+    :param iterable: iterable of items, it is consumed lazily, a WorkQueue can be fed while the map runs
+    :param max_pending: int, max number of items in any stage, default 2 * workers of the first stage
+    :param retry: function (item, result, attempts) ==> seconds to wait before trying the item again,
+                  None to keep the result, eg. retry.Retrier, None to never retry
+    :return: generator of (item, result)
+    """
+    if max_pending is None:
+        max_pending = 2 * stages[0][2]
+
+    executors = []
+    for func, kind, max_workers in stages:
+        if kind == "process":
+            executors.append(concurrent.futures.ProcessPoolExecutor(max_workers=max_workers))
+        else:
+            executors.append(concurrent.futures.ThreadPoolExecutor(max_workers=max_workers))
+
+    items = iter(iterable)
+    # future ==> (item, index of the stage, number of attempts before this one)
+    pending = {}
+    # items waiting for their next attempt
+    delayed = DelayQueue()
+
+    def submit(item, k, arg, attempts):
+        pending[executors[k].submit(stages[k][0], arg)] = (item, k, attempts)
+
+    # name of every stage in the metrics, eg. "stage 1 parse_task"
+    names = [f"stage {k} {getattr(getattr(func, 'func', func), '__name__', 'func')}"
+             for k, (func, _, _) in enumerate(stages)]
+
+    try:
+        while True:
+            # the retries that are due go first, then fresh items fill the free slots
+            while len(pending) < max_pending:
+                due = delayed.pop_due()
+                if due is None:
+                    break
+                item, attempts = due
+                submit(item, 0, item, attempts)
+            for item in itertools.islice(items, max(max_pending - len(pending), 0)):
+                submit(item, 0, item, 0)
+
+            if not pending:
+                if not delayed:
+                    return
+                # nothing in flight, only wait for the next retry
+                time.sleep(delayed.time_to_next())
+                continue
+
+            # items in every stage, and waiting for a retry
+            depths = [0] * len(stages)
+            for _, k, _ in pending.values():
+                depths[k] += 1
+            for name, depth in zip(names, depths):
+                metrics.QUEUE_DEPTH.set(depth, name)
+            metrics.QUEUE_DEPTH.set(len(delayed), "retry")
+
+            done, _ = concurrent.futures.wait(pending, timeout=delayed.time_to_next(),
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                item, k, attempts = pending.pop(future)
+                result = future.result()
+
+                # move to the next stage
+                if k + 1 < len(stages):
+                    submit(item, k + 1, result, attempts)
+                    continue
+
+                # try again later
+                if retry is not None:
+                    delay = retry(item, result, attempts + 1)
+                    if delay is not None:
+                        delayed.push(item, delay, attempts + 1)
+                        continue
+
+                yield item, result
+    finally:
+        # the consumer may stop early, drop what is not started yet
+        for executor in executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+        for name in names:
+            metrics.QUEUE_DEPTH.set(0, name)
+        metrics.QUEUE_DEPTH.set(0, "retry")
+
+
+class WorkQueue:
+    """
+    Items for staged_map that can be added while it runs, the consumer of the results pushes the new items
+    - the items with the lowest priority number are served first, in the order they were added
+    - next() stops when the queue is empty for now, staged_map asks again after the next result,
+      and stops when nothing is queued, running or waiting for a retry
+    """
+
+    def __init__(self):
+        self._heap = []
+        # keeps the order of insertion for the same priority, the items are never compared
+        self._counter = itertools.count()
+
+    def push(self, item, priority=0):
+        """
+        :param item: the item
+        :param priority: int, lower is served first
+        :return:
+        """
+        heapq.heappush(self._heap, (priority, next(self._counter), item))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._heap:
+            raise StopIteration
+        return heapq.heappop(self._heap)[2]
+
+    def __len__(self):
+        return len(self._heap)
@@ -0,0 +1,265 @@
+"""
+Profiling of a sampled crawl run, to tell where the time goes when a run slows down
+- a share of the pages (PROFILE_SAMPLE, the same pages in every run, by url hash) is profiled with cProfile
+  in the stage that handles it: fetch (request_page), parse (parse_paper_page, parse_listing_page)
+  and write (every batch of records, a batch holds the records of many pages)
+- meanwhile the stacks of all the threads of every process are sampled every PROFILE_INTERVAL seconds:
+  the main loop (tqdm, prints), the threads waiting on the network and the parser processes show up side by side
+- the profiler only times the calls, the output of the crawl is the same
+- at the end of the run, in PROFILE_DIR:
+      fetch.prof, parse.prof, write.prof    cProfile stats of the sampled calls, eg. python -m pstats parse.prof
+      stacks.collapsed                      one line "process;thread;module:function;... count" per stack,
+                                            flamegraph.pl stacks.collapsed > flame.svg, or open it in speedscope
+  and the calls, seconds and top functions of every stage are printed
+- the parser processes write their own files when the pool shuts down, they inherit the settings with the fork
+  start method (linux), with spawn only the main process is profiled
+
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import zlib
+import pstats
+import cProfile
+import functools
+import threading
+import collections
+import multiprocessing
+import multiprocessing.util
+
+# share of the pages profiled, 0 to never profile
+SAMPLE = 0.0
+DIRECTORY = "ssrn_profile"
+# seconds between two samples of the stacks
+INTERVAL = 0.01
+
+STAGES = ("fetch", "parse", "write")
+
+
+def configure(sample=0.0, directory="ssrn_profile", interval=0.01):
+    """
+    :param sample: float, share of the pages profiled, 0 to never profile
+    :param directory: str, where the profiles are written
+    :param interval: float, seconds between two samples of the stacks
+    :return:
+    """
+    global SAMPLE, DIRECTORY, INTERVAL
+    SAMPLE = sample or 0.0
+    DIRECTORY = directory
+    INTERVAL = interval
+
+
+def is_sampled(key):
+    """
+    :param key: str, eg. the url of the page, the same key is always sampled or never
+    :return: bool, True if the call is profiled
+    """
+    if SAMPLE <= 0:
+        return False
+    return zlib.crc32(key.encode("utf-8")) % 10000 < SAMPLE * 10000
+
+
+def _short_name(name):
+    # ThreadPoolExecutor-0_3 ==> ThreadPoolExecutor-0, ForkProcess-2 ==> ForkProcess, the stacks of a pool add up
+    return re.sub(r"(_\d+|-\d+)$", "", name)
+
+
+class Profiler:
+    """
+    cProfile stats of the sampled calls of every stage, and the sampled stacks of all threads, in one process
+    """
+
+    def __init__(self, directory, interval):
+        """
+        :param directory: str
+        :param interval: float, seconds between two samples of the stacks
+        """
+        self.directory = directory
+        self.interval = interval
+        self.pid = os.getpid()
+        self.process = _short_name(multiprocessing.current_process().name)
+        self.stats = {}
+        self.calls = collections.Counter()
+        self.seconds = collections.Counter()
+        self.stacks = collections.Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample_stacks, name="profiler", daemon=True)
+        self._thread.start()
+
+        if multiprocessing.parent_process() is not None:
+            # a parser process, its files are written when the pool shuts it down
+            multiprocessing.util.Finalize(self, self.dump, exitpriority=10)
+
+    def call(self, stage, func, args, kwargs):
+        """
+        Run func under cProfile, and add its stats to the stage
+
+        :param stage: str, eg. "parse"
+        :param func: function
+        :param args: tuple
+        :param kwargs: dict
+        :return: output of func
+        """
+        # one profiler per thread at a time, a profiled call inside another one counts in the outer one
+        if getattr(self._local, "busy", False):
+            return func(*args, **kwargs)
+        self._local.busy = True
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            self._local.busy = False
+            stats = pstats.Stats(profile)
+            with self._lock:
+                self.calls[stage] += 1
+                self.seconds[stage] += seconds
+                if stage in self.stats:
+                    self.stats[stage].add(stats)
+                else:
+                    self.stats[stage] = stats
+
+    def _sample_stacks(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: _short_name(thread.name) for thread in threading.enumerate()}
+            samples = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.splitext(os.path.basename(code.co_filename))[0]}:{code.co_name}")
+                    frame = frame.f_back
+                stack += [names.get(ident, "thread"), self.process]
+                samples.append(";".join(reversed(stack)))
+            with self._lock:
+                self.stacks.update(samples)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self):
+        """
+        Write the stats, the stacks and the timings of this process, named after its pid
+        :return:
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            for stage, stats in self.stats.items():
+                stats.dump_stats(os.path.join(self.directory, f"{stage}-{self.pid}.prof"))
+            with open(os.path.join(self.directory, f"stacks-{self.pid}.collapsed"), 'w', encoding="utf-8") as file:
+                file.writelines(f"{stack} {n}\n" for stack, n in self.stacks.items())
+            with open(os.path.join(self.directory, f"stages-{self.pid}.json"), 'w', encoding="utf-8") as file:
+                json.dump({"calls": self.calls, "seconds": self.seconds}, file)
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """
+    :return: Profiler of this process, a forked process builds its own
+    """
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None or _profiler.pid != os.getpid():
+            _profiler = Profiler(DIRECTORY, INTERVAL)
+        return _profiler
+
+
+def profiled(stage, key=None):
+    """
+    Decorator: profile the sampled calls of a function in one stage
+
+    :param stage: "fetch", "parse" or "write"
+    :param key: function of the arguments, return the url that decides if the call is sampled,
+                None to profile every call (while profiling)
+    :return: decorator
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if SAMPLE <= 0 or (key is not None and not is_sampled(key(*args, **kwargs))):
+                return func(*args, **kwargs)
+            return get_profiler().call(stage, func, args, kwargs)
+        return wrapper
+    return decorate
+
+
+def start():
+    """
+    Start a profiled run: the files of the last run are removed, the stacks are sampled from now on
+    :return:
+    """
+    if SAMPLE <= 0:
+        return
+    for path in glob.glob(os.path.join(DIRECTORY, "*-*.prof")) + \
+            glob.glob(os.path.join(DIRECTORY, "stacks-*.collapsed")) + \
+            glob.glob(os.path.join(DIRECTORY, "stages-*.json")):
+        os.remove(path)
+    get_profiler()
+    print(f"profiling {SAMPLE:.1%} of the pages into {DIRECTORY}")
+
+
+def report(top=15):
+    """
+    End a profiled run: merge the files of all processes into {stage}.prof and stacks.collapsed,
+    and print the calls, seconds and top functions (cumulative time) of every stage
+
+    :param top: int, number of functions printed per stage
+    :return: dict, stage ==> {"calls": int, "seconds": float}
+    """
+    global _profiler
+    if SAMPLE <= 0:
+        return {}
+    with _profiler_lock:
+        profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.stop()
+        profiler.dump()
+
+    timings = {stage: {"calls": 0, "seconds": 0.0} for stage in STAGES}
+    for path in glob.glob(os.path.join(DIRECTORY, "stages-*.json")):
+        with open(path, encoding="utf-8") as file:
+            stages = json.load(file)
+        for stage, calls in stages["calls"].items():
+            timing = timings.setdefault(stage, {"calls": 0, "seconds": 0.0})
+            timing["calls"] += calls
+            timing["seconds"] += stages["seconds"][stage]
+
+    stacks = collections.Counter()
+    for path in glob.glob(os.path.join(DIRECTORY, "stacks-*.collapsed")):
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                stack, _, n = line.rstrip("\n").rpartition(" ")
+                stacks[stack] += int(n)
+    with open(os.path.join(DIRECTORY, "stacks.collapsed"), 'w', encoding="utf-8") as file:
+        file.writelines(f"{stack} {n}\n" for stack, n in stacks.most_common())
+
+    print("-" * 80)
+    written = []
+    for stage, timing in timings.items():
+        paths = glob.glob(os.path.join(DIRECTORY, f"{stage}-*.prof"))
+        if not paths:
+            continue
+        written.append(f"{stage}.prof")
+        stats = pstats.Stats(*paths, stream=sys.stdout)
+        stats.dump_stats(os.path.join(DIRECTORY, f"{stage}.prof"))
+        calls = timing["calls"]
+        print(f"{stage}: {calls} calls profiled, {timing['seconds']:.2f} s, "
+              f"{1000 * timing['seconds'] / max(calls, 1):.1f} ms per call")
+        stats.strip_dirs().sort_stats("cumulative").print_stats(top)
+    print(f"profiles in {DIRECTORY}: {', '.join(written + ['stacks.collapsed'])} "
+          f"({sum(stacks.values())} samples)")
+    return timings
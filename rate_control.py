@@ -0,0 +1,164 @@
+"""
+Adaptive rate limiter and AIMD concurrency controller, shared by all the requests
+- additive increase: every success raises the concurrency limit (and the request rate) a little,
+  about +1 for every window of successes
+- multiplicative decrease: a 403/429, a 5xx, a timeout or a soft block ("Page Cannot be Found") cuts them by half,
+  at most once per cooldown, so a burst of failures counts as one
+- the throughput settles at the highest rate the target or the proxy tolerates,
+  instead of a hand-tuned sleep or a hard exit
+
+"""
+
+import time
+import asyncio
+import threading
+
+OK = "ok"
+CONGESTION = "congestion"
+NEUTRAL = "neutral"
+
+
+def outcome(status_code, soft_block=False):
+    """
+    Classify the answer of one request
+
+    :param status_code: int, None if the request failed (timeout, connection error)
+    :param soft_block: bool, the page is a block page although the status is 200
+    :return: OK, CONGESTION or NEUTRAL
+    """
+    if status_code is None or status_code in (403, 429) or status_code >= 500 or soft_block:
+        return CONGESTION
+    if status_code >= 400:
+        # eg. 404, the page does not exist, it says nothing about the load
+        return NEUTRAL
+    return OK
+
+
+class _AIMD:
+    # the state of the controller, without the waiting part
+
+    def __init__(self, max_concurrency, min_concurrency=1, initial_concurrency=None,
+                 max_rate=None, min_rate=0.2, initial_rate=None, increase=1.0, decrease=0.5, cooldown=1.0):
+        """
+        :param max_concurrency: int, max number of requests in flight, eg. the threads of the ScraperAPI plan
+        :param min_concurrency: int
+        :param initial_concurrency: int, default max_concurrency
+        :param max_rate: float, max requests per second, None to only control the concurrency
+        :param min_rate: float, min requests per second
+        :param initial_rate: float, default max_rate
+        :param increase: float, added to the limit for every window of successes
+        :param decrease: float, factor applied to the limit on congestion
+        :param cooldown: float, seconds between two decreases
+        """
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(initial_concurrency or max_concurrency)
+
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate = float(initial_rate or max_rate) if max_rate else None
+
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self.n_ok = 0
+        self.n_congestion = 0
+        self._next_start = 0.0
+        self._last_decrease = 0.0
+
+    def _can_start(self):
+        return self.in_flight < max(int(self.limit), self.min_concurrency)
+
+    def _start(self):
+        # book a slot, return the seconds to wait before sending the request
+        self.in_flight += 1
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        start = max(now, self._next_start)
+        self._next_start = start + 1.0 / self.rate
+        return start - now
+
+    def _update(self, result):
+        self.in_flight -= 1
+
+        if result == OK:
+            self.n_ok += 1
+            # +increase for every window of `limit` successes
+            self.limit = min(self.max_concurrency, self.limit + self.increase / self.limit)
+            if self.rate:
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+        elif result == CONGESTION:
+            self.n_congestion += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self.limit = max(self.min_concurrency, self.limit * self.decrease)
+                if self.rate:
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+
+    def stats(self):
+        """
+        :return: dict, current concurrency limit and rate, requests in flight, number of successes and congestions
+        """
+        return {"limit": round(self.limit, 2),
+                "rate": round(self.rate, 2) if self.rate else None,
+                "in_flight": self.in_flight,
+                "ok": self.n_ok,
+                "congestion": self.n_congestion}
+
+
+class RateController(_AIMD):
+    """
+    AIMD controller for threads, call acquire() before a request and release(outcome) after it
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait for a free slot, and for the pace of the request rate
+        :return:
+        """
+        with self._cond:
+            while not self._can_start():
+                self._cond.wait()
+            delay = self._start()
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, result):
+        """
+        :param result: OK, CONGESTION or NEUTRAL, see outcome()
+        :return:
+        """
+        with self._cond:
+            self._update(result)
+            self._cond.notify_all()
+
+
+class AsyncRateController(_AIMD):
+    """
+    AIMD controller for one asyncio event loop, await acquire() before a request and release(outcome) after it
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(self._can_start)
+            delay = self._start()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, result):
+        async with self._cond:
+            self._update(result)
+            self._cond.notify_all()
@@ -0,0 +1,185 @@
+"""
+Incremental recrawl: refresh the papers already scraped, the volatile fields first
+- views, downloads, rank and citations change all the time, title, abstract and authors almost never,
+  a fingerprint of the stable fields tells if a whole record has to be written again
+- every paper keeps its last values, its validators (ETag / Last-Modified), when it was checked,
+  how many times it was checked and how many times it changed
+- the papers are refreshed by priority: age since the last check times the expected volatility,
+  (changes + 1) / (checks + 2), so the papers that often change come back sooner,
+  the papers never checked come first, a run refreshes at most a budget of papers
+- a conditional request (If-None-Match / If-Modified-Since) is sent when the paper has validators,
+  a 304 costs no parsing and no writing
+- only the fields that changed are written, to {section}/ssrn_updates_{date}.{format},
+  the other fields are left empty, join the updates to the records on abstract_id, the latest one wins
+
+"""
+
+import time
+import sqlite3
+import hashlib
+import threading
+
+import writers
+
+# fields that change all the time, compared one by one
+VOLATILE = ("views", "downloads", "rank", "n_refs")
+# fields that almost never change, compared through one fingerprint
+STABLE = ("title", "abstract", "authors", "journal", "date_posted", "date_revised", "date_written", "universities")
+
+
+def fingerprint(record):
+    """
+    :param record: PaperRecord, output of writers.to_record
+    :return: str, hash of the stable fields
+    """
+    text = "\x1f".join("" if record[name] is None else str(record[name]) for name in STABLE)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def changed_fields(record, previous):
+    """
+    :param record: PaperRecord, new record, output of writers.to_record
+    :param previous: dict, last values of the paper (see RefreshStore.get), None if it was never recorded
+    :return: list of the names of the fields that changed, all fields if the stable ones changed
+    """
+    if previous is None or previous["fingerprint"] != fingerprint(record):
+        return list(STABLE) + list(VOLATILE)
+    return [name for name in VOLATILE if record[name] != previous[name]]
+
+
+def update_record(record, fields):
+    """
+    :param record: PaperRecord, output of writers.to_record
+    :param fields: list of the names of the fields that changed
+    :return: PaperRecord, the record with only abstract_id, url, status and the fields that changed
+    """
+    keep = set(fields) | {"abstract_id", "url", "status"}
+    return writers.PaperRecord(**{name: (value if name in keep else None) for name, value in record.items()})
+
+
+class RefreshStore:
+    """
+    Last values, validators and change history of every paper, shared by all threads
+    """
+
+    def __init__(self, path="ssrn_crawl_state.db"):
+        """
+        :param path: str, path of the sqlite file, it is created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS refresh (
+                abstract_id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                section TEXT NOT NULL,
+                fingerprint TEXT,
+                views INTEGER,
+                downloads INTEGER,
+                rank INTEGER,
+                n_refs INTEGER,
+                etag TEXT,
+                last_modified TEXT,
+                checked_at REAL,
+                n_checks INTEGER NOT NULL DEFAULT 0,
+                n_changes INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+
+    def add(self, papers):
+        """
+        Add papers with no values yet, the papers already known are left as they are
+
+        :param papers: iterable of (abstract_id, url, section)
+        :return:
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("INSERT OR IGNORE INTO refresh (abstract_id, url, section) VALUES (?, ?, ?)",
+                                   papers)
+            self._conn.execute("COMMIT")
+
+    def record(self, records, section):
+        """
+        Keep the values of papers just scraped by the full crawl, they count as one check
+
+        :param records: iterable of PaperRecord, output of writers.to_record, the papers done
+        :param section: str
+        :return:
+        """
+        now = time.time()
+        rows = [(record["abstract_id"], record["url"], section, fingerprint(record),
+                 *(record[name] for name in VOLATILE), now)
+                for record in records if record["abstract_id"] is not None]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO refresh (abstract_id, url, section, fingerprint, views, downloads, rank, n_refs, "
+                "checked_at, n_checks) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1) "
+                "ON CONFLICT (abstract_id) DO UPDATE SET fingerprint = excluded.fingerprint, views = excluded.views, "
+                "downloads = excluded.downloads, rank = excluded.rank, n_refs = excluded.n_refs, "
+                "checked_at = excluded.checked_at, n_checks = n_checks + 1", rows)
+            self._conn.execute("COMMIT")
+
+    def get(self, abstract_id):
+        """
+        :param abstract_id: int
+        :return: dict, last values and validators of the paper, None if it is unknown
+        """
+        with self._lock:
+            self._conn.row_factory = sqlite3.Row
+            try:
+                row = self._conn.execute("SELECT * FROM refresh WHERE abstract_id = ?", (abstract_id,)).fetchone()
+            finally:
+                self._conn.row_factory = None
+        return dict(row) if row else None
+
+    def select(self, budget):
+        """
+        The papers to refresh, the ones never checked first, then by age times expected volatility
+
+        :param budget: int, max number of papers
+        :return: list of (abstract_id, url, section, etag, last_modified)
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT abstract_id, url, section, etag, last_modified FROM refresh "
+                "ORDER BY fingerprint IS NOT NULL, "
+                "(? - COALESCE(checked_at, 0)) * (n_changes + 1.0) / (n_checks + 2.0) DESC "
+                "LIMIT ?", (time.time(), budget)).fetchall()
+
+    def checked(self, abstract_id, record=None, changed=False, etag=None, last_modified=None):
+        """
+        Record one check of a paper
+
+        :param abstract_id: int
+        :param record: PaperRecord, the new record, None if the page did not change (304)
+        :param changed: bool, True if a field changed
+        :param etag: str, ETag of the response, None to keep the last one
+        :param last_modified: str, Last-Modified of the response, None to keep the last one
+        :return:
+        """
+        now = time.time()
+        with self._lock:
+            if record is not None:
+                self._conn.execute("UPDATE refresh SET fingerprint = ?, views = ?, downloads = ?, rank = ?, "
+                                   "n_refs = ? WHERE abstract_id = ?",
+                                   (fingerprint(record), *(record[name] for name in VOLATILE), abstract_id))
+            self._conn.execute("UPDATE refresh SET etag = COALESCE(?, etag), "
+                               "last_modified = COALESCE(?, last_modified), checked_at = ?, "
+                               "n_checks = n_checks + 1, n_changes = n_changes + ? WHERE abstract_id = ?",
+                               (etag, last_modified, now, int(changed), abstract_id))
+
+    def count(self):
+        """
+        :return: int, number of papers known
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM refresh").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,226 @@
+"""
+Persistent cache of the responses, on disk in SQLite
+- keyed by the sha256 of the normalized url, so the same page is stored once
+- the body is compressed with zstd (pip install zstandard), or zlib if it is not installed
+- every entry keeps the status code and the time it was fetched
+- entries older than the ttl are ignored, the least recently used ones are evicted above max_bytes
+- parser fixes can be re-applied to all cached pages offline, see scrape_ssrn_all.reparse_cache
+
+"""
+
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD = "zstd"
+ZLIB = "zlib"
+
+
+def normalize_url(url):
+    """
+    Normalize an url, so that the same page always gives the same key
+    - lower case scheme and host, no fragment
+    - "&amp;" replaced by "&", query parameters sorted
+
+    :param url: str
+    :return: str
+    """
+    parts = urlsplit(url.strip().replace("&amp;", "&"))
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", query, ""))
+
+
+def url_key(url):
+    """
+    :param url: str
+    :return: str, sha256 of the normalized url
+    """
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    """
+    A response read from the cache, with the same attributes as the response of requests
+    """
+
+    def __init__(self, url, status_code, content, fetched_at):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.fetched_at = fetched_at
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+
+class ResponseCache:
+    """
+    Cache of responses shared by all threads
+    """
+
+    def __init__(self, path="ssrn_cache.db", ttl=None, max_bytes=None, level=3):
+        """
+        :param path: str, path of the sqlite file, it is created if it does not exist
+        :param ttl: float, seconds an entry stays valid, None for ever
+        :param max_bytes: int, max size of the compressed bodies, None for no limit
+        :param level: int, compression level
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.level = level
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status_code INTEGER NOT NULL,
+                codec TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+        """)
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        # the zstd compressors must not be shared between threads, one per thread
+        self._local = threading.local()
+
+    def _compress(self, content):
+        if zstandard is not None:
+            if not hasattr(self._local, "compressor"):
+                self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+            return ZSTD, self._local.compressor.compress(content)
+        return ZLIB, zlib.compress(content, self.level)
+
+    def _decompress(self, codec, body):
+        if codec == ZSTD:
+            if zstandard is None:
+                raise ImportError("this cache was written with zstd, run: pip install zstandard")
+            if not hasattr(self._local, "decompressor"):
+                self._local.decompressor = zstandard.ZstdDecompressor()
+            return self._local.decompressor.decompress(body)
+        return zlib.decompress(body)
+
+    def get(self, url):
+        """
+        :param url: str
+        :return: CachedResponse, None if the url is not cached or the entry is too old
+        """
+        key = url_key(url)
+        with self._lock:
+            row = self._conn.execute("SELECT status_code, codec, body, fetched_at FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None or (self.ttl is not None and time.time() - row[3] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+
+        status_code, codec, body, fetched_at = row
+        return CachedResponse(url, status_code, self._decompress(codec, body), fetched_at)
+
+    def put(self, url, status_code, content):
+        """
+        Store one response, and evict the least recently used ones above max_bytes
+
+        :param url: str
+        :param status_code: int
+        :param content: bytes
+        :return:
+        """
+        codec, body = self._compress(content)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (url_key(url),)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (url_key(url), normalize_url(url), status_code, codec, body, len(body), now, now))
+            self._total_bytes += len(body) - (old[0] if old else 0)
+
+            if self.max_bytes is not None and self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, url):
+        """
+        Drop one response, eg. a page with a 200 that did not parse, so that it is requested again
+
+        :param url: str
+        :return: bool, True if the url was cached
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM responses WHERE key = ?", (url_key(url),)).fetchone()
+            if row is None:
+                return False
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (url_key(url),))
+            self._total_bytes -= row[0]
+        return True
+
+    def _evict(self):
+        # delete the least recently used entries, by batch, until the cache is 90% of max_bytes
+        target = 0.9 * self.max_bytes
+        while self._total_bytes > target:
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at LIMIT 100").fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            self._conn.execute("BEGIN")
+            for key, size in rows:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                if self._total_bytes <= target:
+                    break
+            self._conn.execute("COMMIT")
+
+    def iter_responses(self, url_like=None, batch_size=500):
+        """
+        Read the cached responses lazily, eg. to parse all pages again offline
+
+        :param url_like: str, sql LIKE pattern on the url, eg. "%papers.cfm%", None for all
+        :param batch_size: int, number of rows read at a time
+        :return: generator of CachedResponse
+        """
+        query = "SELECT rowid, url, status_code, codec, body, fetched_at FROM responses WHERE rowid > ?"
+        if url_like is not None:
+            query += " AND url LIKE ?"
+        query += " ORDER BY rowid LIMIT ?"
+
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(query, (last, url_like, batch_size) if url_like is not None
+                                          else (last, batch_size)).fetchall()
+            if not rows:
+                return
+            for last, url, status_code, codec, body, fetched_at in rows:
+                yield CachedResponse(url, status_code, self._decompress(codec, body), fetched_at)
+
+    def stats(self):
+        """
+        :return: dict, number of entries, compressed size, hits and misses
+        """
+        with self._lock:
+            n = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"entries": n, "bytes": self._total_bytes, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
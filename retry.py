@@ -0,0 +1,236 @@
+"""
+Retry scheduler with exponential backoff and jitter
+- every failure is classified (connection error or timeout, throttled, server error, soft block, empty page ...)
+  and every error class has an outcome: gone (404, removed paper), transient (network, 5xx), blocked (403, 429,
+  block page) or parse-partial (the page is here, a field did not parse)
+- every error class has its own policy: max number of attempts, base delay, max delay,
+  only the transient and blocked classes are requested again, a page gone or partly parsed never is
+  (a partly parsed page is parsed again from the response cache, see scrape_ssrn_all.reparse_partial)
+- the delay doubles at every attempt, with a random jitter so the retries of a burst do not come back together
+- the failed items wait in a DelayQueue, the workers keep taking fresh items in the meantime,
+  the retries are served first once they are due (see pipeline.staged_map and async_engine._scrape_papers)
+
+"""
+
+import time
+import heapq
+import random
+import itertools
+import collections
+
+import metrics
+
+# error classes
+CONNECTION = "connection"
+THROTTLED = "throttled"
+SERVER = "server"
+SOFT_BLOCK = "soft-block"
+EMPTY = "empty"
+NOT_FOUND = "not-found"
+PARSE = "parse"
+OTHER = "other"
+
+# outcomes of the error classes
+GONE = "gone"
+TRANSIENT = "transient"
+BLOCKED = "blocked"
+PARSE_PARTIAL = "parse-partial"
+
+OUTCOMES = {
+    NOT_FOUND: GONE,
+    CONNECTION: TRANSIENT,
+    SERVER: TRANSIENT,
+    OTHER: TRANSIENT,
+    THROTTLED: BLOCKED,
+    SOFT_BLOCK: BLOCKED,
+    # a page without title nor abstract is a block page more often than a paper
+    EMPTY: BLOCKED,
+    PARSE: PARSE_PARTIAL,
+}
+# the outcomes worth another request
+REFETCH = (TRANSIENT, BLOCKED)
+
+
+class RetryPolicy:
+    """
+    How often and how late one class of errors is tried again
+    """
+
+    def __init__(self, max_attempts, base=1.0, factor=2.0, max_delay=60.0):
+        """
+        :param max_attempts: int, number of attempts, the first one included
+        :param base: float, seconds to wait after the first attempt
+        :param factor: float, the delay is multiplied by factor at every attempt
+        :param max_delay: float, max seconds to wait
+        """
+        self.max_attempts = max_attempts
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+
+    def delay(self, attempts):
+        """
+        :param attempts: int, number of attempts done
+        :return: float, seconds to wait, between half and all of the exponential delay
+        """
+        delay = min(self.max_delay, self.base * self.factor ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+def default_policies(max_attempts=3):
+    """
+    :param max_attempts: int, number of attempts for the network errors, eg. NUM_RETRIES
+    :return: dict, error class ==> RetryPolicy, the classes not in the dict are not retried,
+             only classes whose outcome is in REFETCH
+    """
+    return {
+        CONNECTION: RetryPolicy(max_attempts, base=2),
+        SERVER: RetryPolicy(max_attempts, base=5),
+        # the target or the proxy wants us to slow down, wait longer and try more often
+        THROTTLED: RetryPolicy(max_attempts + 2, base=10, max_delay=300),
+        SOFT_BLOCK: RetryPolicy(2, base=30),
+        # a page without title nor authors, tried once more as the old "rehandle" pass did
+        EMPTY: RetryPolicy(2, base=5),
+        OTHER: RetryPolicy(2, base=5),
+    }
+
+
+def classify(status_code, soft_block=False):
+    """
+    Classify the answer of one request
+
+    :param status_code: int, None if the request failed (timeout, connection error)
+    :param soft_block: bool, the page is a block page although the status is 200
+    :return: error class, None if the request worked
+    """
+    if status_code is None:
+        return CONNECTION
+    if status_code in (401, 403, 407, 429):
+        return THROTTLED
+    if status_code >= 500:
+        return SERVER
+    if status_code in (404, 410):
+        return NOT_FOUND
+    if status_code >= 400:
+        return OTHER
+    if soft_block:
+        return SOFT_BLOCK
+    return None
+
+
+def outcome_of(error_class):
+    """
+    :param error_class: str, None if it worked
+    :return: GONE, TRANSIENT, BLOCKED or PARSE_PARTIAL, None if it worked
+    """
+    if error_class is None:
+        return None
+    return OUTCOMES.get(error_class, TRANSIENT)
+
+
+def class_of_error(error):
+    """
+    :param error: str, error message written as "<error class>: <details>", None if it worked
+    :return: error class, None if it worked
+    """
+    if not error:
+        return None
+    return error.split(":", 1)[0]
+
+
+def backoff(policies, error_class, attempts):
+    """
+    :param policies: dict, error class ==> RetryPolicy
+    :param error_class: str, None if it worked
+    :param attempts: int, number of attempts done
+    :return: float, seconds to wait before the next attempt, None if it should not be tried again
+    """
+    policy = policies.get(error_class) if error_class is not None else None
+    if policy is None or attempts >= policy.max_attempts:
+        return None
+    return policy.delay(attempts)
+
+
+class Retrier:
+    """
+    Decide if and when a failed item is tried again, and count the retries of every error class
+    it is the `retry` function of pipeline.staged_map
+    """
+
+    def __init__(self, classify_result, policies=None, on_error=None):
+        """
+        :param classify_result: function of the result of one item, return its error class, None if it worked
+        :param policies: dict, error class ==> RetryPolicy, default default_policies()
+        :param on_error: function (item, error class), called after every failed attempt, before the item is
+                         tried again or given up, eg. to drop a bad page from the response cache
+        """
+        self.classify_result = classify_result
+        self.policies = default_policies() if policies is None else policies
+        self.on_error = on_error
+        self.n_retries = collections.Counter()
+        self.n_given_up = collections.Counter()
+
+    def __call__(self, item, result, attempts):
+        """
+        :param item: the item, eg. an url
+        :param result: the result of the last attempt
+        :param attempts: int, number of attempts done
+        :return: float, seconds to wait before the next attempt, None to keep the result
+        """
+        error_class = self.classify_result(result)
+        if error_class is not None and self.on_error is not None:
+            self.on_error(item, error_class)
+        delay = backoff(self.policies, error_class, attempts)
+        if delay is not None:
+            self.n_retries[error_class] += 1
+            metrics.RETRIES.inc(error_class)
+        elif error_class is not None:
+            self.n_given_up[error_class] += 1
+            metrics.GIVEN_UP.inc(error_class)
+        return delay
+
+    def stats(self):
+        """
+        :return: dict, number of retries and of items given up, for every error class
+        """
+        return {"retries": dict(self.n_retries), "given_up": dict(self.n_given_up)}
+
+
+class DelayQueue:
+    """
+    Items waiting for their next attempt, the earliest due first
+    """
+
+    def __init__(self):
+        self._heap = []
+        # keeps the order of insertion for the same due time, the items are never compared
+        self._counter = itertools.count()
+
+    def push(self, item, delay, attempts):
+        """
+        :param item: the item to try again
+        :param delay: float, seconds to wait
+        :param attempts: int, number of attempts done
+        :return:
+        """
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), item, attempts))
+
+    def pop_due(self):
+        """
+        :return: (item, attempts) of the earliest item that is due, None if no item is due
+        """
+        if self._heap and self._heap[0][0] <= time.monotonic():
+            _, _, item, attempts = heapq.heappop(self._heap)
+            return item, attempts
+        return None
+
+    def time_to_next(self):
+        """
+        :return: float, seconds until the earliest item is due, None if the queue is empty
+        """
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - time.monotonic())
+
+    def __len__(self):
+        return len(self._heap)
@@ -0,0 +1,161 @@
+"""
+Priority scheduler of the streaming crawl, so that a run cut short by a budget, a time limit or a Ctrl-C
+has the most valuable papers, and papers of every section, instead of whatever came first
+- the papers are ranked in their section by the keys of PRIORITY_KEYS, read from the listing pages:
+      "newest"       the latest date posted first
+      "downloads"    the most downloaded first
+  a paper the listing pages told nothing of comes after the others, in the order it was found
+- the sections take turns by fair share: the next paper comes from the section with the fewest papers served
+  in this run, with "fewest_done" the papers completed in the previous runs count too,
+  so the sections with the fewest completed papers catch up first
+- SECTION_QUOTA caps the papers of one section in one run (a float is a share of PAPER_BUDGET),
+  PAPER_BUDGET caps the papers of the run and CRAWL_SECONDS its time,
+  the papers left stay pending in the crawl state, the next run ranks them again
+- the listing pages are not ranked, they go in the order they are queued
+
+"""
+
+import time
+import heapq
+import datetime
+import itertools
+import collections
+
+NEWEST = "newest"
+DOWNLOADS = "downloads"
+FEWEST_DONE = "fewest_done"
+KEYS = (NEWEST, DOWNLOADS, FEWEST_DONE)
+
+
+def rank(keys, posted=None, downloads=None):
+    """
+    :param keys: tuple of KEYS, eg. PRIORITY_KEYS, the keys of the sections are left out
+    :param posted: str, date posted in iso format, None if unknown
+    :param downloads: int, None if unknown
+    :return: tuple, sort key of a paper in its section, lower is served first
+    """
+    key = []
+    for name in keys:
+        if name == NEWEST:
+            key.append(-datetime.date.fromisoformat(posted).toordinal() if posted else 0)
+        elif name == DOWNLOADS:
+            key.append(-downloads if downloads is not None else 1)
+    return tuple(key)
+
+
+class Scheduler:
+    """
+    Items for staged_map that can be added while it runs, as pipeline.WorkQueue, with groups (the sections)
+    - the items with the lowest priority number are served first
+    - the items of a group are served by rank, the groups take turns by fair share,
+      the items without group go before the groups of the same priority, in the order they were added
+    - next() stops when nothing can be served for now, or for good once the budget or the time is spent
+    """
+
+    def __init__(self, keys=(), budget=None, quota=None, seconds=None, done=None):
+        """
+        :param keys: tuple of KEYS, eg. PRIORITY_KEYS
+        :param budget: int, max items served from the groups, None for no limit
+        :param quota: int, max items served per group, a float is a share of budget, None for no limit
+        :param seconds: float, no item is served after that many seconds, None for no limit
+        :param done: dict, group ==> items completed in the previous runs, only used with "fewest_done"
+        """
+        unknown = set(keys) - set(KEYS)
+        if unknown:
+            raise ValueError(f"unknown priority keys {sorted(unknown)}, the keys are {KEYS}")
+        if isinstance(quota, float):
+            if budget is None:
+                raise ValueError("a SECTION_QUOTA share needs a PAPER_BUDGET")
+            quota = max(1, int(quota * budget))
+        self.keys = tuple(keys)
+        self.budget = budget
+        self.quota = quota
+        self.deadline = time.monotonic() + seconds if seconds is not None else None
+        self.done = dict(done or {}) if FEWEST_DONE in self.keys else {}
+
+        # priority ==> group ==> heap of (rank, counter, item)
+        self._items = {}
+        # priority ==> heap of (load, counter, group) of the groups with items to serve, one entry per group
+        self._turns = {}
+        # keeps the order of insertion for the same rank, the items are never compared
+        self._counter = itertools.count()
+        self._len = 0
+        self.served = collections.Counter()
+        self.n_served = 0
+        # "budget" or "time" once the run is over
+        self.stopped = None
+
+    def is_ranked(self):
+        """
+        :return: bool, True if the papers are ranked, they need the hints of the listing pages
+        """
+        return NEWEST in self.keys or DOWNLOADS in self.keys
+
+    def is_capped(self, group):
+        """
+        :param group: the group, eg. name of the section, None for the items without group
+        :return: bool, True if the group cannot be served any more in this run
+        """
+        if group is None:
+            return False
+        return (self.budget is not None and self.n_served >= self.budget) or \
+            (self.quota is not None and self.served[group] >= self.quota)
+
+    def _load(self, group):
+        # the group with the lowest load is served next
+        if group is None:
+            return -1
+        return self.served[group] + self.done.get(group, 0)
+
+    def push(self, item, priority=0, group=None, rank=()):
+        """
+        :param item: the item
+        :param priority: int, lower is served first
+        :param group: eg. name of the section, None for an item served in the order it was added
+        :param rank: tuple, lower is served first in the group, see rank()
+        :return:
+        """
+        items = self._items.setdefault(priority, {}).setdefault(group, [])
+        if not items and not self.is_capped(group):
+            heapq.heappush(self._turns.setdefault(priority, []), (self._load(group), next(self._counter), group))
+        heapq.heappush(items, (rank, next(self._counter), item))
+        self._len += 1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.stopped is None:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.stopped = "time"
+            elif self.budget is not None and self.n_served >= self.budget:
+                self.stopped = "budget"
+        if self.stopped is not None:
+            raise StopIteration
+
+        for priority in sorted(self._turns):
+            turns = self._turns[priority]
+            while turns:
+                _, _, group = heapq.heappop(turns)
+                # a group over its quota keeps its items, they are left for the next run
+                if self.is_capped(group):
+                    continue
+                items = self._items[priority][group]
+                item = heapq.heappop(items)[2]
+                self._len -= 1
+                if group is not None:
+                    self.served[group] += 1
+                    self.n_served += 1
+                if items:
+                    heapq.heappush(turns, (self._load(group), next(self._counter), group))
+                return item
+        raise StopIteration
+
+    def __len__(self):
+        return self._len
+
+    def stats(self):
+        """
+        :return: dict, items served from the groups, items left, groups served, and why the run stopped
+        """
+        return {"served": self.n_served, "left": self._len, "groups": len(self.served), "stopped": self.stopped}
@@ -0,0 +1,85 @@
+"""
+Requests of the async engine (async_engine.py) on an httpx.MockTransport, nothing is sent on the network
+
+run: python -m pytest tests
+
+"""
+
+import os
+import sys
+import asyncio
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retry
+import async_engine
+import scrape_ssrn_all as ssrn
+
+URL = "https://papers.ssrn.com/sol3/papers.cfm?abstract_id=1"
+
+
+@pytest.fixture(autouse=True)
+def settings(tmp_path, monkeypatch):
+    # the response cache in the temporary directory, one direct endpoint, almost no wait between the attempts
+    monkeypatch.chdir(tmp_path)
+    saved = {"ENDPOINTS": ssrn.ENDPOINTS, "REPLAY_URL": ssrn.REPLAY_URL}
+    ssrn.configure(ENDPOINTS=[{"kind": "direct"}], REPLAY_URL=None)
+    monkeypatch.setattr(ssrn, "RETRY_POLICIES", {retry.CONNECTION: retry.RetryPolicy(3, base=0.001)})
+    yield
+    ssrn.configure(**saved)
+
+
+def request(handler, max_attempts):
+    """
+    :param handler: function request ==> httpx.Response, or raises
+    :param max_attempts: int
+    :return: response of async_engine.request_page
+    """
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await async_engine.request_page(client, async_engine.make_limiter(), URL, max_attempts,
+                                                   use_cache=False)
+    return asyncio.run(run())
+
+
+def failing(errors):
+    """
+    :param errors: list of exception classes, raised by the first requests, then the page is answered
+    :return: handler, the number of requests in handler.calls
+    """
+    def handler(request):
+        handler.calls += 1
+        if handler.calls <= len(errors):
+            raise errors[handler.calls - 1]("failed", request=request)
+        return httpx.Response(200, text="<html><h1>paper</h1></html>")
+    handler.calls = 0
+    return handler
+
+
+@pytest.mark.parametrize("error", [httpx.ConnectError, httpx.ReadTimeout, httpx.DecodingError,
+                                   httpx.TooManyRedirects])
+def test_error_is_retried(error):
+    # a bad gzip body or a redirect loop is not a TransportError, it is retried as one
+    handler = failing([error])
+    response = request(handler, max_attempts=3)
+
+    assert handler.calls == 2
+    assert response.status_code == 200
+
+
+def test_error_is_a_connection_error():
+    handler = failing([httpx.DecodingError])
+    response = request(handler, max_attempts=1)
+
+    assert handler.calls == 1
+    assert response is None
+    assert ssrn.error_class_of_response(response) == retry.CONNECTION
+
+
+def test_error_every_time():
+    handler = failing([httpx.RemoteProtocolError] * 5)
+    assert request(handler, max_attempts=3) is None
+    assert handler.calls == 3
@@ -0,0 +1,80 @@
+"""
+Durable crawl state (crawl_state.py) on a sqlite file in a temporary directory
+
+run: python -m pytest tests
+
+"""
+
+import os
+import sys
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crawl_state
+
+URL = "https://papers.ssrn.com/sol3/papers.cfm?abstract_id=1"
+
+
+def n_results(path, url):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT n_results FROM urls WHERE url = ?", (url,)).fetchone()[0]
+
+
+def test_status_and_results_recorded(tmp_path):
+    path = str(tmp_path / "state.db")
+    state = crawl_state.CrawlState(path)
+    state.add([URL], "Section1", crawl_state.PAPER)
+    assert state.status(URL, "Section1") == crawl_state.PENDING
+    assert not state.is_finished(URL, "Section1")
+
+    state.mark(URL, "Section1", crawl_state.FAILED, "throttled: 429")
+    state.mark(URL, "Section1", crawl_state.PARTIAL)
+    # known urls keep their status
+    state.add([URL], "Section1", crawl_state.PAPER)
+    assert state.is_finished(URL, "Section1")
+    assert state.count("Section1", crawl_state.PAPER) == {crawl_state.PARTIAL: 1}
+    assert list(state.iter_urls("Section1", crawl_state.PAPER, statuses=(crawl_state.PARTIAL,))) == [URL]
+    state.close()
+
+    assert n_results(path, URL) == 2
+
+
+def test_state_file_of_an_older_version(tmp_path):
+    path = str(tmp_path / "state.db")
+    with sqlite3.connect(path) as conn:
+        conn.executescript("""
+            CREATE TABLE urls (url TEXT NOT NULL, section TEXT NOT NULL, kind TEXT NOT NULL,
+                               status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+                               last_error TEXT, updated_at REAL, PRIMARY KEY (url, section));
+            CREATE TABLE sections (section TEXT PRIMARY KEY, n_total INTEGER);
+        """)
+        conn.execute("INSERT INTO urls (url, section, kind, status, attempts) VALUES (?, 'Section1', 'paper', "
+                     "'failed', 3)", (URL,))
+
+    state = crawl_state.CrawlState(path)
+    state.mark(URL, "Section1", crawl_state.DONE)
+    state.set_n_total("Section1", 12, page_size=50)
+    assert state.get_page_size("Section1") == 50
+    state.close()
+
+    assert n_results(path, URL) == 4
+
+
+def test_cross_listed_papers_are_finished(tmp_path):
+    path = str(tmp_path / "state.db")
+    state = crawl_state.CrawlState(path)
+    other = URL[:-1] + "2"
+    state.add([URL, other], "Section2", crawl_state.PAPER)
+    state.mark(other, "Section2", crawl_state.NOT_FOUND)
+
+    state.mark_cross_listed([(URL, "Section2", "Section1"), (other, "Section2", "Section1"),
+                             (URL, "Section3", "Section1")])
+    assert state.status(URL, "Section2") == crawl_state.CROSS_LISTED
+    assert state.is_finished(URL, "Section2")
+    # a paper finished in this section keeps its status, an unknown one is not added
+    assert state.status(other, "Section2") == crawl_state.NOT_FOUND
+    assert state.count("Section3", crawl_state.PAPER) == {}
+    state.close()
+
+    assert n_results(path, URL) == 1
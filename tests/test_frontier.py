@@ -0,0 +1,86 @@
+"""
+Cross-section frontier (frontier.py): the bitmaps of ids, claim and done, saved in a temporary directory
+
+run: python -m pytest tests
+
+"""
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import frontier
+
+
+def url(i):
+    return f"https://papers.ssrn.com/sol3/papers.cfm?abstract_id={i}"
+
+
+def test_abstract_id():
+    assert frontier.abstract_id(url(3999999)) == 3999999
+    assert frontier.abstract_id("https://papers.ssrn.com/sol3/papers.cfm?abstract_id=12&type=2") == 12
+    assert frontier.abstract_id("https://papers.ssrn.com/sol3/cf_dev/AbsByAuth.cfm?per_id=1") is None
+
+
+def test_id_set_as_a_set():
+    ids = random.Random(0).sample(range(5_000_000), 2000)
+    id_set = frontier.IdSet()
+    assert all(id_set.add(i) for i in ids)
+    # added twice: already in the set
+    assert not any(id_set.add(i) for i in ids[:100])
+
+    assert len(id_set) == len(set(ids))
+    assert list(id_set) == sorted(ids)
+    assert all(i in id_set for i in ids)
+    assert 5_000_001 not in id_set and 0 not in id_set
+    assert id_set.to_int().bit_count() == len(ids)
+
+
+def test_id_set_bytes_round_trip():
+    id_set = frontier.IdSet()
+    for i in (0, 7, 8, 4999999):
+        id_set.add(i)
+    data = id_set.to_bytes()
+    # 5 million ids fit in 625 KB, a sparse bitmap compresses to a few KB
+    assert len(data) < 5000
+
+    loaded = frontier.IdSet.from_bytes(data)
+    assert list(loaded) == [0, 7, 8, 4999999]
+    assert len(loaded) == 4
+
+
+def test_claim_once_per_run(tmp_path):
+    papers = frontier.Frontier(str(tmp_path / "frontier.db"))
+    assert papers.claim(url(1))
+    # listed in another section: already queued
+    assert not papers.claim(url(1))
+    # no abstract_id: de-duplicated on the url
+    other = "https://papers.ssrn.com/sol3/Delivery.cfm?id=5"
+    assert papers.claim(other)
+    assert not papers.claim(other)
+    assert papers.stats()["queued"] == 2
+
+
+def test_done_and_tags_are_saved(tmp_path):
+    path = str(tmp_path / "frontier.db")
+    papers = frontier.Frontier(path)
+    papers.tag([url(1), url(2)], "Section1")
+    papers.tag([url(2), url(3)], "Section2")
+    for i in (1, 2, 3):
+        papers.claim(url(i))
+    papers.mark_done([url(1), url(2)])
+    papers.close()
+
+    # the next run: the papers done are not claimed again, the one queued but not done is
+    papers = frontier.Frontier(path)
+    assert papers.is_done(url(1)) and papers.is_done(url(2)) and not papers.is_done(url(3))
+    assert not papers.claim(url(1))
+    assert papers.claim(url(3))
+
+    assert papers.is_tagged(url(2), "Section1") and not papers.is_tagged(url(3), "Section1")
+    assert sorted(papers.sections_of(url(2))) == ["Section1", "Section2"]
+    assert sorted(papers.iter_tags()) == [(1, "Section1"), (2, "Section1"), (2, "Section2"), (3, "Section2")]
+    assert papers.stats() == {"done": 2, "queued": 1, "tagged": 3, "cross_listed": 1}
+    papers.close()
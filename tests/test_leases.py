@@ -0,0 +1,144 @@
+"""
+Leases of the distributed crawl (leases.py) on a sqlite file in a temporary directory,
+and a coordinator with a worker on a local fake_ssrn.py server
+
+run: python -m pytest tests
+
+"""
+
+import os
+import sys
+import glob
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import leases
+import fake_ssrn
+import scrape_ssrn_all as ssrn
+
+URLS = [f"https://papers.ssrn.com/sol3/papers.cfm?abstract_id={i}" for i in range(1, 6)]
+
+
+def new_store(tmp_path):
+    store = leases.LeaseStore(str(tmp_path / "leases.db"))
+    assert store.add([(url, "Section1", i % 2) for i, url in enumerate(URLS)], batch_size=2) == len(URLS)
+    return store
+
+
+def lease_all(store, worker, lease_seconds=300):
+    leased = {}
+    while True:
+        batch = store.lease(worker, lease_seconds)
+        if batch is None:
+            return leased
+        leased[batch[0]] = batch[1]
+
+
+def test_batches_of_one_shard(tmp_path):
+    store = new_store(tmp_path)
+    leased = lease_all(store, "w1")
+
+    # shard 0: 3 papers in batches of 2, shard 1: 2 papers
+    assert sorted(len(papers) for papers in leased.values()) == [1, 2, 2]
+    assert sorted(url for papers in leased.values() for url, section in papers) == sorted(URLS)
+    assert store.counts() == {leases.LEASED: 3}
+    # known papers are not batched twice
+    assert store.add([(url, "Section1", 0) for url in URLS]) == 0
+
+
+def test_complete_and_results(tmp_path):
+    store = new_store(tmp_path)
+    leased = lease_all(store, "w1")
+    for batch_id, papers in leased.items():
+        assert store.complete(batch_id, "w1", [(url, section, {"url": url}) for url, section in papers])
+
+    rows = store.iter_results()
+    assert all(payload == {"url": url} for result_id, url, section, payload in rows)
+    assert len(rows) == len(URLS)
+    assert store.is_finished()
+
+    store.ack(rows[1][0])
+    assert [row[0] for row in store.iter_results()] == [row[0] for row in rows[2:]]
+
+
+def test_expired_lease_goes_to_another_worker(tmp_path):
+    store = new_store(tmp_path)
+    batch_id, papers = store.lease("w1", lease_seconds=0.01)
+    time.sleep(0.05)
+
+    # the first lease of the store is the oldest batch, the one whose lease expired
+    assert store.lease("w2")[0] == batch_id
+    assert store.renew([batch_id], "w1") == []
+    assert store.renew([batch_id], "w2") == [batch_id]
+    # the results of the worker that lost the lease are dropped
+    assert not store.complete(batch_id, "w1", [(url, section, None) for url, section in papers])
+    assert store.complete(batch_id, "w2", [(url, section, None) for url, section in papers])
+    assert len(store.iter_results()) == len(papers)
+
+
+def test_failed_batch_is_queued_again(tmp_path):
+    store = new_store(tmp_path)
+    for _ in range(2):
+        batch_id, papers = store.lease("w1", lease_seconds=0.01)
+        time.sleep(0.05)
+
+    # leased max_leases times: failed, not leased again in this run
+    assert store.expire(max_leases=2) == 1
+    assert store.counts()[leases.FAILED] == 1
+    assert batch_id not in lease_all(store, "w2", lease_seconds=0.01)
+
+    assert store.requeue_failed() == 1
+    assert store.lease("w3")[0] == batch_id
+
+
+def test_paper_failed_in_a_done_batch_is_added_again(tmp_path):
+    store = new_store(tmp_path)
+    leased = lease_all(store, "w1")
+    for batch_id, papers in leased.items():
+        store.complete(batch_id, "w1", [(url, section, None) for url, section in papers])
+    store.ack(store.iter_results()[-1][0])
+    assert store.is_finished()
+
+    # the next coordinator run adds the papers that are not finished in its crawl state
+    failed = URLS[1]
+    assert store.add([(failed, "Section1", 1)]) == 1
+    batch_id, papers = store.lease("w2")
+    assert papers == [(failed, "Section1")]
+
+    # a result reported but not written yet is not batched again
+    store.complete(batch_id, "w2", [(failed, "Section1", None)])
+    assert store.add([(failed, "Section1", 1)]) == 0
+    store.ack(store.iter_results()[-1][0])
+    assert store.add([(failed, "Section1", 1)]) == 1
+
+
+def test_coordinator_and_worker(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = fake_ssrn.start(synthetic=fake_ssrn.SyntheticSSRN(n_papers=60, n_sections=2, page_size=20))
+    settings = {"REPLAY_URL": server.url, "ENDPOINTS": [{"kind": "direct", "max_concurrency": 4}],
+                "CITATIONS": False, "NUM_PARSERS": 0, "NUM_THREADS": 4, "LEASE_BATCH_SIZE": 5, "LEASE_SECONDS": 3}
+    saved = {name: getattr(ssrn, name) for name in settings}
+    ssrn.configure(**settings)
+    try:
+        coordinator = threading.Thread(target=ssrn.crawl_network, kwargs={"role": "coordinator"})
+        coordinator.start()
+        # the worker stops when no batch is pending or leased, it starts once the first section is added
+        store = leases.LeaseStore(ssrn.LEASE_DB)
+        while not store.counts() and coordinator.is_alive():
+            time.sleep(0.1)
+        assert ssrn.work_on_leases("w1") == store.counts()[leases.DONE]
+        coordinator.join(60)
+        assert not coordinator.is_alive()
+    finally:
+        ssrn.configure(**saved)
+        server.shutdown()
+
+    # every paper written once, in the first section that listed it, nothing left to write
+    assert store.is_finished() and store.iter_results() == []
+    n_written = 0
+    for path in glob.glob("*/ssrn_info.csv"):
+        with open(path, encoding="utf-8") as file:
+            n_written += sum(1 for _ in file) - 1
+    assert n_written == 60
@@ -0,0 +1,214 @@
+"""
+Both parser backends against the extraction of the original scraper, on saved ssrn pages (tests/pages)
+- original_paper and original_listing are find_info_in_one_paper and find_lst_paper as they were before parsers.py,
+  only the request is left out: they take the soup, and return the link of the citation widget
+  instead of requesting it
+- the original wrapped abstract, journal and universities in quotes for the csv file, csv.writer quotes them now
+
+run: python -m pytest tests
+
+"""
+
+import os
+import sys
+
+import pytest
+from bs4 import BeautifulSoup
+from ordered_set import OrderedSet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parsers
+
+PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+PAPERS = ["paper_full.html", "paper_new.html"]
+LISTINGS = ["listing_first.html", "listing_single.html"]
+BACKENDS = ["bs4", "lxml"]
+URL = "https://papers.ssrn.com/sol3/papers.cfm?abstract_id=1"
+
+
+def read(name):
+    with open(os.path.join(PAGES, name), 'rb') as file:
+        return file.read()
+
+
+def original_paper(soup, url):
+    # the main body
+    body = soup.find(class_="container abstract-body")
+
+    # the list of text
+    text_list = OrderedSet(soup.get_text().split("\n")) - {''}
+
+    # find title
+    title = body.find('h1').get_text().replace("\n", "")
+
+    # find author
+    authors = text_list[0].replace(title, "").replace(" :: SSRN", "").replace(" by ", "")
+
+    # find abstract
+    # need to add quotation mark for conveniently storing in csv
+    abstract = "\"{}\"".format(body.find(class_="abstract-text").get_text().replace("\n", "").replace("Abstract", ""))
+
+    # find journal
+    if body.find(class_="reference-info"):
+        journal = "\"{}\"".format(body.find(class_="reference-info").get_text().replace("\n", ""))
+    else:
+        journal = " "
+
+    # find date ==> post date, last revisit date
+    date = body.find(class_="note note-list").get_text().replace("\n", ", ")
+    if "Pages" in date:
+        date = date.split("Pages, ")[1]
+    else:
+        date = date.replace(", ", "")
+
+    # find date ==> writen day
+    date_written = [line for line in text_list if "Date Written" in line]
+    if len(date_written) > 0:
+        date_written = date_written[0]
+    date = date + str(date_written)
+
+    # find university
+    universities = body.find(class_="authors authors-full-width").find_all("p")
+    universities = [university.get_text() for university in universities]
+
+    # convert list to string with ";" as seperator
+    universities = "\"{}\"".format(",".join(universities))
+
+    # find paper statistics
+    stats = OrderedSet(body.find('div', attrs={'class': 'box-paper-statics'}).get_text().split("\n"))
+
+    views, dl, rank, n_refs, n_cit = "", "", "", "", ""
+    try:
+        views = stats[stats.index('Abstract Views') + 1].strip().replace(",", "")
+    except Exception:
+        pass
+
+    try:
+        dl = stats[stats.index('Downloads') + 1].strip().replace(",", "")
+    except Exception:
+        pass
+
+    try:
+        rank = stats[stats.index('rank') + 1].strip().replace(",", "")
+    except Exception:
+        pass
+
+    # reference
+    try:
+        refs = body.find(class_="references-citations").get_text().split()
+        n_refs = [n for n in refs if n.isdigit()][0]
+    except Exception:
+        pass
+
+    # citations
+    cit = None
+    try:
+        # return a link
+        cit = body.find(id="citations-widget-abstract")["data-url"]
+    except Exception:
+        pass
+
+    # combine all results
+    results = [url, title, abstract, authors, journal, date, universities, views, dl, rank, n_refs, n_cit]
+    return results, cit
+
+
+def original_listing(soup, get_total=False):
+    # find the body that contains all url
+    body = soup.find(class_="tbody")
+
+    # find the urls
+    title_url = body.find_all(class_="title optClickTitle", href=True)
+
+    # transform into list
+    lst_title_url = [i["href"] for i in title_url]
+
+    # get total number of pages
+    if get_total:
+        if soup.find(class_="results-header").find(class_="total"):
+            n_total = soup.find(class_="results-header").find(class_="total").get_text()
+        else:
+            # may not one page
+            n_total = 1
+        return lst_title_url, n_total
+    else:
+        return lst_title_url
+
+
+def unquote(results):
+    # abstract, journal and universities without the quotes of the original
+    return [value[1:-1] if i in (2, 4, 6) and value.startswith('"') else value for i, value in enumerate(results)]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("name", PAPERS)
+def test_paper_fields(name, backend):
+    content = read(name)
+    expected, expected_cit = original_paper(BeautifulSoup(content, "html.parser"), URL)
+    missing = []
+    results, cit = parsers.parse_paper(content, URL, backend=backend, missing=missing)
+
+    assert missing == []
+    for field, value, expected_value in zip(parsers.FIELDS, results, unquote(expected)):
+        assert value == expected_value, field
+    assert cit == expected_cit
+
+
+def test_paper_fields_are_read():
+    # the fixtures are not empty pages: the comparison above would pass on fields that are empty on both sides
+    results, cit = parsers.parse_paper(read("paper_full.html"), URL, backend="lxml")
+    fields = dict(zip(parsers.FIELDS, results))
+
+    assert fields["title"] == "Momentum Crashes & Volatility Timing"
+    assert fields["authors"] == "Kent Daniel, Tobias J. Moskowitz, Ana María Gómez"
+    assert fields["journal"].strip() == "Journal of Financial Economics, Vol. 122, No. 2, 2016"
+    assert "Date Written: November 1, 2013" in fields["date"]
+    assert fields["universities"].endswith(",Université Paris-Dauphine")
+    assert (fields["views"], fields["downloads"], fields["rank"], fields["n_refs"]) == ("48271", "9312", "1207", "58")
+    assert cit == "https://papers.ssrn.com/sol3/citations-widget.cfm?abstract_id=2371227&type=abstract"
+
+
+def test_paper_without_affiliations():
+    # the original gave up on the whole page, both backends keep the other fields and name the missing one
+    content = read("paper_partial.html")
+    parsed = {}
+    for backend in BACKENDS:
+        missing = []
+        parsed[backend] = parsers.parse_paper(content, URL, backend=backend, missing=missing)
+        assert missing == ["universities"]
+
+    assert parsed["bs4"] == parsed["lxml"]
+    results, cit = parsed["lxml"]
+    assert results[parsers.FIELDS.index("universities")] == ""
+    assert results[parsers.FIELDS.index("title")] == "Liquidity and Asset Prices"
+    assert results[parsers.FIELDS.index("downloads")] == "311"
+    assert cit is not None
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("name", LISTINGS)
+def test_listing(name, backend):
+    content = read(name)
+    soup = BeautifulSoup(content, "html.parser")
+
+    assert parsers.parse_listing(content, backend=backend) == original_listing(soup)
+    assert parsers.parse_listing(content, get_total=True, backend=backend) == original_listing(soup, get_total=True)
+
+
+def test_listing_hints():
+    content = read("listing_first.html")
+    hints = {backend: {} for backend in BACKENDS}
+    for backend in BACKENDS:
+        parsers.parse_listing(content, backend=backend, hints=hints[backend])
+
+    assert hints["bs4"] == hints["lxml"]
+    assert hints["lxml"] == {
+        "https://papers.ssrn.com/sol3/papers.cfm?abstract_id=4999001": ("02 Oct 2026", "12"),
+        "https://papers.ssrn.com/sol3/papers.cfm?abstract_id=2371227": ("11 Dec 2013", "9,312"),
+        "https://papers.ssrn.com/sol3/papers.cfm?abstract_id=3341200": ("3 Mar 2019", ""),
+    }
+
+
+def test_compare_backends():
+    assert parsers.compare_backends([os.path.join(PAGES, name) for name in PAPERS + ["paper_partial.html"]]) == 0
@@ -0,0 +1,121 @@
+"""
+Bounded pipeline on thread and process pools (pipeline.py): order of the results, bounds, failures and retries
+
+run: python -m pytest tests
+
+"""
+
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pipeline
+
+
+def test_results_in_the_order_they_complete():
+    def wait(seconds):
+        time.sleep(seconds)
+        return seconds * 10
+
+    results = list(pipeline.bounded_map(wait, [0.3, 0.0, 0.15], max_workers=3))
+    assert results == [(0.0, 0.0), (0.15, 1.5), (0.3, 3.0)]
+
+
+def test_at_most_max_pending_items():
+    lock = threading.Lock()
+    running = [0, 0]
+    read = []
+
+    def work(item):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return item
+
+    def items():
+        for i in range(50):
+            read.append(i)
+            yield i
+
+    results = pipeline.bounded_map(work, items(), max_workers=8, max_pending=4)
+    first = next(results)
+    # the items are read lazily, only enough to fill the free slots
+    assert len(read) <= 5
+    assert sorted([first[0]] + [item for item, result in results]) == list(range(50))
+    assert running[1] <= 4
+
+
+def test_stages_chain_threads_and_processes():
+    stages = [(lambda item: item * 2, "thread", 2), (str, "process", 2), (lambda text: text + "!", "thread", 1)]
+    results = dict(pipeline.staged_map(stages, range(20), max_pending=6))
+    assert results == {i: f"{2 * i}!" for i in range(20)}
+
+
+def test_failure_propagates_and_stops_the_pools():
+    started = []
+
+    def work(item):
+        started.append(item)
+        if item == 3:
+            raise ValueError("bad item")
+        time.sleep(0.01)
+        return item
+
+    with pytest.raises(ValueError, match="bad item"):
+        for _ in pipeline.bounded_map(work, range(1000), max_workers=2):
+            pass
+    # the items not started yet are dropped, the rest of the iterable is not read
+    time.sleep(0.05)
+    assert len(started) < 20
+
+
+def test_failed_items_are_retried_after_a_delay():
+    attempts_seen = {}
+
+    def work(item):
+        attempts_seen[item] = attempts_seen.get(item, 0) + 1
+        return "failed" if item % 2 and attempts_seen[item] < 3 else "ok"
+
+    def retry(item, result, attempts):
+        return 0.01 if result == "failed" else None
+
+    results = dict(pipeline.bounded_map(work, range(10), max_workers=2, retry=retry))
+    assert results == {i: "ok" for i in range(10)}
+    assert attempts_seen == {i: 3 if i % 2 else 1 for i in range(10)}
+
+
+def test_retry_gives_up_with_the_last_result():
+    calls = []
+
+    def retry(item, result, attempts):
+        calls.append(attempts)
+        return 0.0 if attempts < 3 else None
+
+    assert list(pipeline.bounded_map(lambda item: "failed", ["a"], max_workers=1, retry=retry)) == [("a", "failed")]
+    assert calls == [1, 2, 3]
+
+
+def test_work_queue_fed_while_the_map_runs():
+    queue = pipeline.WorkQueue()
+    queue.push(("listing", 1))
+    served = []
+    for item, result in pipeline.bounded_map(lambda item: item, queue, max_workers=1, max_pending=1):
+        served.append(item)
+        kind, number = item
+        # a listing page queues its papers and the next listing page, the papers go first
+        if kind == "listing" and number < 3:
+            queue.push(("listing", number + 1), priority=1)
+            for paper in range(2):
+                queue.push(("paper", 10 * number + paper), priority=0)
+
+    assert served == [("listing", 1), ("paper", 10), ("paper", 11), ("listing", 2), ("paper", 20), ("paper", 21),
+                      ("listing", 3)]
+    assert len(queue) == 0
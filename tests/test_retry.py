@@ -0,0 +1,106 @@
+"""
+Classification of the failures, backoff and the delay queue of the retries (retry.py)
+
+run: python -m pytest tests
+
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retry
+
+
+@pytest.mark.parametrize("status_code, soft_block, error_class", [
+    (200, False, None),
+    (304, False, None),
+    (None, False, retry.CONNECTION),
+    (403, False, retry.THROTTLED),
+    (429, False, retry.THROTTLED),
+    (407, False, retry.THROTTLED),
+    (500, False, retry.SERVER),
+    (503, False, retry.SERVER),
+    (404, False, retry.NOT_FOUND),
+    (410, False, retry.NOT_FOUND),
+    (400, False, retry.OTHER),
+    (200, True, retry.SOFT_BLOCK),
+    # the status wins over the page
+    (429, True, retry.THROTTLED),
+])
+def test_classify(status_code, soft_block, error_class):
+    assert retry.classify(status_code, soft_block) == error_class
+
+
+def test_outcomes():
+    assert retry.outcome_of(None) is None
+    assert retry.outcome_of(retry.NOT_FOUND) == retry.GONE
+    assert retry.outcome_of(retry.PARSE) == retry.PARSE_PARTIAL
+    assert retry.outcome_of(retry.SOFT_BLOCK) == retry.BLOCKED
+    assert retry.outcome_of("unknown") == retry.TRANSIENT
+    assert retry.class_of_error("throttled: 429") == retry.THROTTLED
+    assert retry.class_of_error(None) is None
+
+
+def test_only_the_refetch_outcomes_have_a_policy():
+    for error_class in retry.default_policies():
+        assert retry.outcome_of(error_class) in retry.REFETCH
+    for error_class in (retry.NOT_FOUND, retry.PARSE):
+        assert retry.backoff(retry.default_policies(), error_class, 1) is None
+
+
+def test_backoff_doubles_with_jitter():
+    policy = retry.RetryPolicy(10, base=1.0, factor=2.0, max_delay=6.0)
+    for attempts, full in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 6.0), (9, 6.0)]:
+        delays = [policy.delay(attempts) for _ in range(200)]
+        # between half and all of the exponential delay, not the same for every item
+        assert all(full / 2 <= delay <= full for delay in delays)
+        assert len(set(delays)) > 1
+
+
+def test_backoff_stops_after_max_attempts():
+    policies = {retry.CONNECTION: retry.RetryPolicy(3, base=1.0)}
+    assert retry.backoff(policies, None, 1) is None
+    assert retry.backoff(policies, retry.CONNECTION, 1) is not None
+    assert retry.backoff(policies, retry.CONNECTION, 2) is not None
+    assert retry.backoff(policies, retry.CONNECTION, 3) is None
+    # no policy, no retry
+    assert retry.backoff(policies, retry.SERVER, 1) is None
+
+
+def test_retrier_counts_and_reports():
+    errors = []
+    retrier = retry.Retrier(lambda result: result, {retry.SERVER: retry.RetryPolicy(2, base=0.5)},
+                            on_error=lambda item, error_class: errors.append((item, error_class)))
+
+    assert retrier("a", None, 1) is None
+    assert 0.25 <= retrier("b", retry.SERVER, 1) <= 0.5
+    assert retrier("b", retry.SERVER, 2) is None
+    assert retrier("c", retry.NOT_FOUND, 1) is None
+
+    assert errors == [("b", retry.SERVER), ("b", retry.SERVER), ("c", retry.NOT_FOUND)]
+    assert retrier.stats() == {"retries": {retry.SERVER: 1}, "given_up": {retry.SERVER: 1, retry.NOT_FOUND: 1}}
+
+
+def test_delay_queue_serves_the_earliest_due():
+    queue = retry.DelayQueue()
+    assert queue.pop_due() is None
+    assert queue.time_to_next() is None
+
+    queue.push("late", 0.2, 1)
+    queue.push("first", 0.0, 2)
+    queue.push("second", 0.0, 1)
+    assert len(queue) == 3
+    # both due: the earliest pushed first
+    assert queue.pop_due() == ("first", 2)
+    assert queue.pop_due() == ("second", 1)
+    assert queue.pop_due() is None
+    assert 0 < queue.time_to_next() <= 0.2
+
+    time.sleep(queue.time_to_next())
+    assert queue.pop_due() == ("late", 1)
+    assert len(queue) == 0
@@ -0,0 +1,98 @@
+"""
+Priority scheduler of the streaming crawl (scheduler.py): rank, fair share between sections, budget and quota
+
+run: python -m pytest tests
+
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scheduler
+
+
+def test_rank():
+    assert scheduler.rank((scheduler.NEWEST,), "2026-10-02") < scheduler.rank((scheduler.NEWEST,), "2013-12-11")
+    assert scheduler.rank((scheduler.DOWNLOADS,), downloads=9312) < scheduler.rank((scheduler.DOWNLOADS,),
+                                                                                    downloads=12)
+    # unknown: after the others
+    assert scheduler.rank((scheduler.NEWEST,), "2013-12-11") < scheduler.rank((scheduler.NEWEST,))
+    assert scheduler.rank((scheduler.DOWNLOADS,), downloads=0) < scheduler.rank((scheduler.DOWNLOADS,))
+    # the keys of the sections are not in the rank of a paper
+    assert scheduler.rank((scheduler.FEWEST_DONE,), "2013-12-11", 12) == ()
+
+
+def test_sections_take_turns():
+    queue = scheduler.Scheduler()
+    for i in range(4):
+        queue.push(f"a{i}", group="A")
+    for i in range(2):
+        queue.push(f"b{i}", group="B")
+
+    assert list(queue) == ["a0", "b0", "a1", "b1", "a2", "a3"]
+    assert queue.stats() == {"served": 6, "left": 0, "groups": 2, "stopped": None}
+
+
+def test_rank_in_the_section():
+    queue = scheduler.Scheduler(keys=(scheduler.DOWNLOADS,))
+    for name, downloads in [("few", 3), ("unknown", None), ("many", 300)]:
+        queue.push(name, group="A", rank=scheduler.rank(queue.keys, downloads=downloads))
+    assert list(queue) == ["many", "few", "unknown"]
+
+
+def test_items_without_section_and_priorities():
+    queue = scheduler.Scheduler()
+    queue.push("paper", group="A")
+    queue.push("listing 2", priority=1)
+    queue.push("listing 1")
+    assert list(queue) == ["listing 1", "paper", "listing 2"]
+
+
+def test_fewest_done_catch_up():
+    queue = scheduler.Scheduler(keys=(scheduler.FEWEST_DONE,), done={"A": 2})
+    for i in range(3):
+        queue.push(f"a{i}", group="A")
+        queue.push(f"b{i}", group="B")
+    # B had 2 papers fewer: it is served until it catches up, then they take turns
+    assert list(queue)[:4] == ["b0", "b1", "a0", "b2"]
+
+
+def test_budget():
+    queue = scheduler.Scheduler(budget=3)
+    for i in range(5):
+        queue.push(i, group="A")
+    assert list(queue) == [0, 1, 2]
+    assert queue.stats() == {"served": 3, "left": 2, "groups": 1, "stopped": "budget"}
+    # over for good, the new items are left for the next run
+    queue.push(9, group="B")
+    assert list(queue) == []
+
+
+def test_quota_leaves_the_section_for_the_next_run():
+    queue = scheduler.Scheduler(budget=10, quota=0.2)
+    for i in range(5):
+        queue.push(f"a{i}", group="A")
+        queue.push(f"b{i}", group="B")
+    queue.push("c0", group="C")
+
+    assert sorted(queue) == ["a0", "a1", "b0", "b1", "c0"]
+    assert len(queue) == 6
+    assert queue.stopped is None
+
+
+def test_time_limit():
+    queue = scheduler.Scheduler(seconds=0)
+    queue.push("listing")
+    assert list(queue) == []
+    assert queue.stopped == "time"
+
+
+def test_bad_settings():
+    with pytest.raises(ValueError):
+        scheduler.Scheduler(keys=("oldest",))
+    with pytest.raises(ValueError):
+        scheduler.Scheduler(quota=0.5)
@@ -0,0 +1,84 @@
+"""
+Connection counts of the shared transport (transport.py) on a local fake_ssrn.py server,
+which also serves as an http proxy: it answers the absolute urls a proxy gets
+
+run: python -m pytest tests
+
+"""
+
+import os
+import sys
+import asyncio
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_ssrn
+import transport
+
+PATH = "/sol3/papers.cfm?abstract_id=1"
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = fake_ssrn.start(synthetic=fake_ssrn.SyntheticSSRN(n_papers=20, n_sections=1))
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def settings():
+    saved = (transport.POOL_SIZE, transport.HTTP2, transport.REPLAY_URL or "")
+    yield
+    transport.configure(*saved)
+    transport.close()
+
+
+@pytest.mark.parametrize("http2", [False, True])
+def test_keep_alive(server, http2):
+    transport.configure(pool_size=4, http2=http2, replay_url="")
+    transport.close()
+    for _ in range(5):
+        assert transport.get(server.url + PATH, timeout=5).status_code == 200
+    assert transport.stats() == {"requests": 5, "connections": 1, "reused": 4}
+
+
+@pytest.mark.parametrize("http2", [False, True])
+def test_through_a_proxy(server, http2):
+    transport.configure(pool_size=4, http2=http2, replay_url="")
+    transport.close()
+    for _ in range(5):
+        response = transport.get("http://papers.ssrn.com" + PATH, timeout=5, proxy=server.url)
+        assert response.status_code == 200
+    # the connection to the proxy is counted, and kept open
+    assert transport.stats() == {"requests": 5, "connections": 1, "reused": 4}
+
+
+def test_new_connection_after_close(server):
+    transport.configure(pool_size=4, http2=False, replay_url="")
+    transport.close()
+    transport.get(server.url + PATH, timeout=5)
+    transport.get_session().close()
+    transport.get(server.url + PATH, timeout=5)
+    assert transport.stats()["connections"] == 2
+
+
+def test_async_requests(server):
+    transport.close()
+
+    async def run():
+        limits = httpx.Limits(max_connections=3, max_keepalive_connections=3)
+        async with httpx.AsyncClient(limits=limits) as client:
+            for _ in range(3):
+                responses = await asyncio.gather(*(client.get(server.url + PATH, extensions=transport.TRACE_ASYNC)
+                                                   for _ in range(3)))
+                for response in responses:
+                    transport.count_async_request(response)
+
+    asyncio.run(run())
+    stats = transport.stats()
+    assert stats["requests"] == 9
+    # the first three requests open the connections, the next ones reuse them
+    assert 1 <= stats["connections"] <= 3
@@ -0,0 +1,125 @@
+"""
+Typed records and the streaming writers (writers.py): a RecordBatch written to csv, jsonl and parquet
+reads back the same rows, in a temporary directory
+
+run: python -m pytest tests
+
+"""
+
+import os
+import csv
+import sys
+import json
+import glob
+import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import writers
+
+URL = "https://papers.ssrn.com/sol3/papers.cfm?abstract_id={}"
+
+
+def records():
+    full = writers.to_record(
+        [URL.format(2371227), "Momentum Crashes", "An abstract, with \"quotes\"\nand a new line",
+         "Kent Daniel, Ana María Gómez", "Journal of Financial Economics", "Posted: 11 Dec 2013, "
+         "Last revised: 5 Mar 2014Date Written: November 1, 2013", "Columbia,Université Paris-Dauphine",
+         "48,271", "9,312", "1,207", "58", ""], "done")
+    # what a partly parsed page gives
+    partial = writers.to_record([URL.format(3341200), "Liquidity", "", "A. Author", " ", "", "", "", "311",
+                                 "", "", None], "partial")
+    return [full, partial]
+
+
+def expected_rows():
+    return [record.values() for record in records()]
+
+
+def test_to_record_types():
+    full, partial = records()
+    assert full.abstract_id == 2371227
+    assert (full.views, full.downloads, full.rank, full.n_refs, full.n_cit) == (48271, 9312, 1207, 58, None)
+    assert (full.date_posted, full.date_revised, full.date_written) == \
+        (datetime.date(2013, 12, 11), datetime.date(2014, 3, 5), datetime.date(2013, 11, 1))
+    assert full["universities"] == "Columbia,Université Paris-Dauphine"
+    # empty fields are missing values
+    assert (partial.abstract, partial.journal, partial.date_posted, partial.views) == (None, None, None, None)
+    assert partial.downloads == 311
+
+
+def test_parse_values():
+    assert writers.to_int("1,234") == 1234
+    assert writers.to_int("n/a") is None
+    assert writers.to_int(str(2 ** 63)) is None
+    assert writers.to_date("March 2012") == datetime.date(2012, 3, 1)
+    assert writers.to_date("soon") is None
+    assert writers.split_dates("Posted: 10 Jan 2013Date Written: 2012Date Written: 2012") == \
+        (datetime.date(2013, 1, 10), None, datetime.date(2012, 1, 1))
+
+
+def test_record_batch_round_trip():
+    batch = writers.RecordBatch(records())
+    assert len(batch) == 2
+    assert list(batch) == records()
+    assert list(batch.rows()) == expected_rows()
+    assert batch.column("journal") == ["Journal of Financial Economics", None]
+
+    batch.clear()
+    assert len(batch) == 0 and list(batch.rows()) == []
+    # the buffers are used again after a clear
+    batch.append(records()[1])
+    assert list(batch.rows()) == expected_rows()[1:]
+
+
+def write_twice(directory, output_format):
+    # two runs append to the same file
+    for record in records():
+        writer = writers.open_writer(str(directory), output_format)
+        writer.write(writers.RecordBatch([record]))
+        writer.write(writers.RecordBatch())
+        writer.close()
+
+
+def as_text(value):
+    return "" if value is None else str(value)
+
+
+def test_csv_round_trip(tmp_path):
+    write_twice(tmp_path, "csv")
+    with open(tmp_path / "ssrn_info.csv", encoding="utf-8", newline="") as file:
+        rows = list(csv.reader(file))
+
+    assert rows[0] == writers.COLUMNS
+    assert rows[1:] == [[as_text(value) for value in row] for row in expected_rows()]
+
+
+def test_jsonl_round_trip(tmp_path):
+    write_twice(tmp_path, "jsonl")
+    with open(tmp_path / "ssrn_info.jsonl", encoding="utf-8") as file:
+        rows = [json.loads(line) for line in file]
+
+    assert rows == [{name: value.isoformat() if isinstance(value, datetime.date) else value
+                     for name, value in zip(writers.COLUMNS, row)} for row in expected_rows()]
+
+
+def test_parquet_round_trip(tmp_path):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    write_twice(tmp_path, "parquet")
+    parts = sorted(glob.glob(str(tmp_path / "ssrn_info-*.parquet")))
+    # one part file per batch, named after its first row
+    assert [os.path.basename(part) for part in parts] == ["ssrn_info-0000000.parquet", "ssrn_info-0000001.parquet"]
+
+    table = pyarrow.concat_tables([pyarrow.parquet.read_table(part) for part in parts])
+    assert table.schema.field("views").type == pyarrow.int64()
+    assert table.schema.field("date_posted").type == pyarrow.date32()
+    assert [tuple(row.values()) for row in table.to_pylist()] == expected_rows()
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        writers.open_writer(str(tmp_path), "xlsx")
@@ -0,0 +1,496 @@
+"""
+Streaming output of the paper records, with a typed schema
+- ints for views, downloads, rank, refs and citations, real dates for posted / last revised / written
+- a record is a PaperRecord (slots, ints, interned journal and universities), a batch keeps them by column
+  in flat buffers (RecordBatch): the ints and dates in arrays, the text of every column in one bytearray,
+  parquet arrays are built on these buffers, csv rows are zipped from the columns, no dict per row
+- one file per section, the records are written by batch through a buffered file:
+  "csv" and "jsonl" append to ssrn_info.csv / ssrn_info.jsonl, the next runs append to the same file
+  "parquet" writes one row group per batch, in part files ssrn_info-{first row}.parquet
+  (a parquet file is only readable once closed, so every batch is closed before it is recorded as done)
+- read a section back with one call, eg. pandas.read_csv("section/ssrn_info.csv") or pandas.read_parquet("section")
+
+"""
+
+import os
+import sys
+import csv
+import glob
+import json
+import array
+import datetime
+
+from frontier import abstract_id
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+# name, type of every column
+SCHEMA = [
+    ("abstract_id", int),
+    ("url", str),
+    ("title", str),
+    ("abstract", str),
+    ("authors", str),
+    ("journal", str),
+    ("date_posted", datetime.date),
+    ("date_revised", datetime.date),
+    ("date_written", datetime.date),
+    ("universities", str),
+    ("views", int),
+    ("downloads", int),
+    ("rank", int),
+    ("n_refs", int),
+    ("n_cit", int),
+    ("status", str),
+]
+COLUMNS = [name for name, _ in SCHEMA]
+
+# the same few values for many papers, one copy of each
+INTERNED = ("journal", "universities", "status")
+
+
+def to_int(text):
+    """
+    :param text: str, eg. "1,234"
+    :return: int, None if the text is not a number, or a number too large for an int64 column
+    """
+    try:
+        value = int(str(text).replace(",", "").strip())
+    except ValueError:
+        return None
+    return value if -2 ** 63 <= value < 2 ** 63 else None
+
+
+def to_date(text, formats=("%d %b %Y", "%B %d, %Y", "%B %Y", "%Y")):
+    """
+    :param text: str, eg. "10 Jan 2013" or "March 1, 2012"
+    :param formats: formats tried in order
+    :return: datetime.date, None if the text is not a date
+    """
+    text = text.strip()
+    for date_format in formats:
+        try:
+            return datetime.datetime.strptime(text, date_format).date()
+        except ValueError:
+            pass
+    return None
+
+
+def split_dates(date):
+    """
+    split the date field of the parsers, eg. "Posted: 10 Jan 2013, Last revised: 5 Mar 2014Date Written: March 1, 2012"
+
+    :param date: str
+    :return: date posted, date last revised, date written, datetime.date or None
+    """
+    date_written = None
+    if "Date Written:" in date:
+        date, written = date.split("Date Written:", 1)
+        # the same line may come twice
+        date_written = to_date(written.split("Date Written:")[-1])
+
+    date_posted, date_revised = None, None
+    for part in date.split(","):
+        if "Posted:" in part:
+            date_posted = to_date(part.split("Posted:", 1)[1])
+        elif "Last revised:" in part:
+            date_revised = to_date(part.split("Last revised:", 1)[1])
+    return date_posted, date_revised, date_written
+
+
+class PaperRecord:
+    """
+    Typed record of one paper, one attribute per column of SCHEMA, None for the missing values,
+    record["views"] reads it as a dict would
+    """
+    __slots__ = tuple(COLUMNS)
+
+    def __init__(self, **values):
+        for name in COLUMNS:
+            setattr(self, name, values.pop(name, None))
+        if values:
+            raise TypeError(f"unknown columns {sorted(values)}")
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __eq__(self, other):
+        return isinstance(other, PaperRecord) and self.values() == other.values()
+
+    def __repr__(self):
+        return f"PaperRecord(abstract_id={self.abstract_id!r}, status={self.status!r})"
+
+    def values(self):
+        """
+        :return: tuple, values in the order of COLUMNS
+        """
+        return tuple(getattr(self, name) for name in COLUMNS)
+
+    def items(self):
+        return zip(COLUMNS, self.values())
+
+    def as_dict(self):
+        return dict(self.items())
+
+
+def to_record(results, status=None):
+    """
+    Convert the results of one paper (see parsers.FIELDS) into a typed record
+
+    :param results: list of results
+    :param status: str, status of the paper in the crawl state
+    :return: PaperRecord
+    """
+    url, title, abstract, authors, journal, date, universities, views, dl, rank, n_refs, n_cit = results
+    date_posted, date_revised, date_written = split_dates(date or "")
+
+    def text(value):
+        value = (value or "").strip()
+        return value or None
+
+    def shared(value):
+        value = text(value)
+        return sys.intern(value) if value is not None else None
+
+    return PaperRecord(
+        abstract_id=abstract_id(url),
+        url=url,
+        title=text(title),
+        abstract=text(abstract),
+        authors=text(authors),
+        journal=shared(journal),
+        date_posted=date_posted,
+        date_revised=date_revised,
+        date_written=date_written,
+        universities=shared(universities),
+        views=to_int(views),
+        downloads=to_int(dl),
+        rank=to_int(rank),
+        n_refs=to_int(n_refs),
+        n_cit=to_int(n_cit),
+        status=sys.intern(status) if status is not None else None,
+    )
+
+
+def _arrow_nulls(values, valid):
+    # the rows flagged 0 in valid are nulls in the arrow array
+    if valid.count(0) == 0:
+        return values
+    mask = pyarrow.Array.from_buffers(pyarrow.uint8(), len(valid), [None, pyarrow.py_buffer(valid)])
+    return pyarrow.compute.if_else(mask.cast(pyarrow.bool_()), values, pyarrow.scalar(None, values.type))
+
+
+class _IntColumn:
+    """
+    Ints of one column in an array of int64, a bytearray flags the values that are there (1) or None (0)
+    """
+    __slots__ = ("data", "valid")
+
+    def __init__(self):
+        self.data = array.array("q")
+        self.valid = bytearray()
+
+    def __len__(self):
+        return len(self.valid)
+
+    def append(self, value):
+        self.valid.append(value is not None)
+        self.data.append(value if value is not None else 0)
+
+    def values(self):
+        """
+        :return: list, one python value per row, None for the missing ones
+        """
+        values = self.data.tolist()
+        if self.valid.count(0) == 0:
+            return values
+        return [value if valid else None for value, valid in zip(values, self.valid)]
+
+    def to_arrow(self, arrow_type):
+        """
+        :param arrow_type: pyarrow type of the column, its values have the layout of the array
+        :return: pyarrow.Array, built on the buffers of the column, without a copy of the values
+        """
+        values = pyarrow.Array.from_buffers(arrow_type, len(self), [None, pyarrow.py_buffer(self.data)])
+        return _arrow_nulls(values, self.valid)
+
+    def clear(self):
+        del self.data[:]
+        del self.valid[:]
+
+
+class _DateColumn(_IntColumn):
+    """
+    Dates of one column as days since 1970-01-01 in an array of int32, as an arrow date32
+    """
+    __slots__ = ()
+    EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+    def __init__(self):
+        self.data = array.array("i")
+        self.valid = bytearray()
+
+    def append(self, value):
+        self.valid.append(value is not None)
+        self.data.append(value.toordinal() - self.EPOCH if value is not None else 0)
+
+    def values(self):
+        return [datetime.date.fromordinal(value + self.EPOCH) if valid else None
+                for value, valid in zip(self.data, self.valid)]
+
+
+class _TextColumn(_IntColumn):
+    """
+    Strings of one column, utf-8 encoded one after the other in a bytearray,
+    with the offsets of the rows in an array of int64, as an arrow large_string
+    """
+    __slots__ = ("offsets",)
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array.array("q", [0])
+        self.valid = bytearray()
+
+    def append(self, value):
+        self.valid.append(value is not None)
+        if value is not None:
+            self.data += value.encode("utf-8")
+        self.offsets.append(len(self.data))
+
+    def values(self):
+        data, offsets = self.data, self.offsets
+        if data.isascii():
+            # one byte per character, the offsets of the bytes are the offsets in the text
+            data = data.decode("ascii")
+            return [data[offsets[i]:offsets[i + 1]] if valid else None for i, valid in enumerate(self.valid)]
+        return [data[offsets[i]:offsets[i + 1]].decode("utf-8") if valid else None
+                for i, valid in enumerate(self.valid)]
+
+    def to_arrow(self, arrow_type):
+        values = pyarrow.Array.from_buffers(pyarrow.large_string(), len(self),
+                                            [None, pyarrow.py_buffer(self.offsets), pyarrow.py_buffer(self.data)])
+        return _arrow_nulls(values, self.valid).cast(arrow_type)
+
+    def clear(self):
+        del self.data[:]
+        del self.offsets[1:]
+        del self.valid[:]
+
+
+class _SharedColumn:
+    """
+    Interned strings of one column (INTERNED), a list of references to the few values shared by many records
+    """
+    __slots__ = ("data",)
+
+    def __init__(self):
+        self.data = []
+
+    def __len__(self):
+        return len(self.data)
+
+    def append(self, value):
+        self.data.append(value)
+
+    def values(self):
+        return list(self.data)
+
+    def to_arrow(self, arrow_type):
+        return pyarrow.array(self.data, type=arrow_type)
+
+    def clear(self):
+        self.data.clear()
+
+
+def _new_column(name, column_type):
+    if name in INTERNED:
+        return _SharedColumn()
+    return {int: _IntColumn, datetime.date: _DateColumn, str: _TextColumn}[column_type]()
+
+
+class RecordBatch:
+    """
+    Records kept by column until the batch is written, in flat buffers: ints and dates in arrays,
+    the text of title, abstract, authors and url in one bytearray per column, the strings of the parser are let go
+    """
+    __slots__ = ("columns",)
+
+    def __init__(self, records=()):
+        """
+        :param records: iterable of PaperRecord
+        """
+        self.columns = {name: _new_column(name, column_type) for name, column_type in SCHEMA}
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return len(self.columns["url"])
+
+    def __iter__(self):
+        # a PaperRecord per row, only for the few that need one, eg. the refresh store
+        for values in self.rows():
+            yield PaperRecord(**dict(zip(COLUMNS, values)))
+
+    def append(self, record):
+        """
+        :param record: PaperRecord
+        :return:
+        """
+        for name, column in self.columns.items():
+            column.append(getattr(record, name))
+
+    def column(self, name):
+        """
+        :param name: str, name of the column, see COLUMNS
+        :return: list, the python values of the column, None for the missing ones
+        """
+        return self.columns[name].values()
+
+    def rows(self):
+        """
+        :return: iterator of tuples, values in the order of COLUMNS
+        """
+        return zip(*(self.column(name) for name in COLUMNS))
+
+    def clear(self):
+        for column in self.columns.values():
+            column.clear()
+
+
+def as_batch(records):
+    """
+    :param records: RecordBatch, or iterable of PaperRecord
+    :return: RecordBatch
+    """
+    return records if isinstance(records, RecordBatch) else RecordBatch(records)
+
+
+class CsvWriter:
+    """
+    Append the records to one csv file, with a header row
+    """
+    extension = "csv"
+
+    def __init__(self, path):
+        """
+        :param path: str, eg. section/ssrn_info.csv
+        """
+        self.path = path
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', encoding="utf-8", newline="", buffering=1024 * 1024)
+        self._writer = csv.writer(self._file)
+        if new:
+            self._writer.writerow(COLUMNS)
+
+    def write(self, records):
+        """
+        :param records: RecordBatch, or list of PaperRecord
+        :return:
+        """
+        # csv writes None as an empty field
+        self._writer.writerows(as_batch(records).rows())
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlWriter:
+    """
+    Append the records to one json lines file, dates in iso format
+    """
+    extension = "jsonl"
+
+    def __init__(self, path):
+        """
+        :param path: str, eg. section/ssrn_info.jsonl
+        """
+        self.path = path
+        self._file = open(path, 'a', encoding="utf-8", buffering=1024 * 1024)
+
+    def write(self, records):
+        """
+        :param records: RecordBatch, or list of PaperRecord
+        :return:
+        """
+        self._file.write("".join(json.dumps(dict(zip(COLUMNS, values)), ensure_ascii=False, default=str) + "\n"
+                                 for values in as_batch(records).rows()))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """
+    Write every batch of records as one row group, in its own part file, eg. section/ssrn_info-0000100.parquet
+    """
+    extension = "parquet"
+
+    def __init__(self, path, first_row=None):
+        """
+        :param path: str, eg. section/ssrn_info.parquet, the part files are named after it
+        :param first_row: int, number of the first record, eg. the records written by the previous runs,
+                          None to start after the records of the part files already written
+        """
+        if pyarrow is None:
+            raise ImportError('OUTPUT_FORMAT = "parquet" needs pyarrow, run: pip install pyarrow')
+        self.path = path
+        self.n_rows = self.rows_written() if first_row is None else first_row
+        types = {int: pyarrow.int64(), str: pyarrow.string(), datetime.date: pyarrow.date32()}
+        self.schema = pyarrow.schema([(name, types[column_type]) for name, column_type in SCHEMA])
+
+    def rows_written(self):
+        """
+        :return: int, number of records in the part files of the path, eg. of the runs of the same day
+        """
+        base, extension = os.path.splitext(self.path)
+        return sum(pyarrow.parquet.read_metadata(path_part).num_rows
+                   for path_part in glob.glob(f"{glob.escape(base)}-[0-9]*{extension}"))
+
+    def write(self, records):
+        """
+        :param records: RecordBatch, or list of PaperRecord
+        :return:
+        """
+        batch = as_batch(records)
+        if not len(batch):
+            return
+        # one arrow array per column, on the buffers of the batch
+        table = pyarrow.Table.from_arrays([batch.columns[field.name].to_arrow(field.type)
+                                           for field in self.schema], schema=self.schema)
+        base, extension = os.path.splitext(self.path)
+        path_part = f"{base}-{self.n_rows:07d}{extension}"
+        # write then rename, a part file is complete or missing
+        pyarrow.parquet.write_table(table, path_part + ".tmp", compression="zstd")
+        os.replace(path_part + ".tmp", path_part)
+        self.n_rows += len(batch)
+
+    def close(self):
+        pass
+
+
+def open_writer(directory, output_format="csv", first_row=None, file_name="ssrn_info"):
+    """
+    :param directory: str, eg. the directory of the section
+    :param output_format: "csv", "jsonl" or "parquet"
+    :param first_row: int, number of records written by the previous runs, names the parquet part files,
+                      None to count the records of the part files already written
+    :param file_name: str, name of the file without extension
+    :return: CsvWriter, JsonlWriter or ParquetWriter
+    """
+    path = os.path.join(directory, f"{file_name}.{output_format}")
+    if output_format == "csv":
+        return CsvWriter(path)
+    if output_format == "jsonl":
+        return JsonlWriter(path)
+    if output_format == "parquet":
+        return ParquetWriter(path, first_row)
+    raise ValueError(f"output format must be one of {FORMATS}, not {output_format!r}")